@@ -0,0 +1,272 @@
+"""
+Headless benchmark of PendantDropAnalysis on synthetic pendant drops.
+
+Reports the analysis rate (frames per second, in total and per stage) and the
+surface tension error for every analyzer configuration, as a regression baseline
+for changes to the analysis. Run from the repository root:
+
+    python -m analysis.benchmark --frames 20 --output benchmark.csv
+
+or only the regression case of a drop that moves out of the ROI:
+
+    python -m analysis.benchmark --roi-shift
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from analysis.image_analysis import PendantDropAnalysis
+from analysis.synthetic_drop import render_pendant_drop
+
+CONFIGURATIONS = {
+    "contour": {"method": "contour"},
+    "profile": {"method": "profile", "subpixel": False},
+    "profile subpixel": {"method": "profile"},
+    "young laplace": {"method": "profile", "engine": "young_laplace"},
+}
+
+# (surface tension in mN/m, apex radius in mm) of the synthetic drops
+CASES = [(72.0, 1.6), (50.0, 1.4), (35.0, 1.1)]
+NEEDLE_DIAMETER = 1.8  # mm
+# shifts in px of the drop between two frames, far enough to leave the ROI
+ROI_SHIFTS = [105, 120, 150]
+ROI_SHIFT_TOLERANCE = 0.5  # %, maximum deviation from a full frame measurement
+
+
+def render_frames(
+    surface_tension: float,
+    apex_radius: float,
+    n_frames: int,
+    scale: float,
+    density: float,
+    binning: int = 1,
+    noise: float = 2.0,
+    blur: float = 1.0,
+    seed: int = 0,
+):
+    """
+    Render a series of frames of the same drop, jittered by a few pixels and with
+    fresh sensor noise, like consecutive camera frames of a hanging drop.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_frames):
+        image, truth = render_pendant_drop(
+            surface_tension=surface_tension,
+            density=density,
+            scale=scale,
+            apex_radius=apex_radius,
+            needle_diameter=NEEDLE_DIAMETER,
+            centre=1224 + rng.uniform(-2, 2),
+            apex_height=1850 + rng.uniform(-2, 2),
+            noise=noise,
+            blur=blur,
+            seed=seed + i,
+        )
+        if binning > 1:
+            image = cv2.resize(
+                image,
+                None,
+                fx=1 / binning,
+                fy=1 / binning,
+                interpolation=cv2.INTER_AREA,
+            )
+        frames.append(image)
+    return frames, truth
+
+
+def benchmark_configuration(frames: list, truth: dict, scale: float, density: float, **kwargs):
+    """
+    Analyse frames with one analyzer configuration.
+
+    :return: dictionary with the rates, the surface tension errors and the number
+        of frames the analysis failed on
+    """
+    analyzer = PendantDropAnalysis(scale=scale, density=density, **kwargs)
+    durations = []
+    stage_durations = {}
+    surface_tensions = []
+    failed = 0
+    for frame in frames:
+        start = time.perf_counter()
+        try:
+            measurement = analyzer.measure(frame)
+        except Exception:
+            failed += 1
+            continue
+        durations.append(time.perf_counter() - start)
+        surface_tensions.append(measurement.surface_tension)
+        for stage, duration in measurement.timings.items():
+            stage_durations.setdefault(stage, []).append(duration)
+
+    result = {"failed frames": failed}
+    if durations:
+        errors = 100 * (np.array(surface_tensions) / truth["surface_tension"] - 1)
+        result["fps"] = 1 / np.mean(durations)
+        for stage, stage_duration in stage_durations.items():
+            result[f"fps {stage}"] = 1 / np.mean(stage_duration)
+        result["error mean (%)"] = errors.mean()
+        result["error std (%)"] = errors.std()
+        result["error max (%)"] = np.abs(errors).max()
+    return result
+
+
+def run_benchmark(
+    n_frames: int = 20,
+    configurations: list = None,
+    scale: float = 0.0027,
+    density: float = 0.998,
+    binning: int = 1,
+    noise: float = 2.0,
+    blur: float = 1.0,
+):
+    """
+    Benchmark the analyzer configurations on all CASES.
+
+    :param n_frames: number of frames per case
+    :param configurations: names of CONFIGURATIONS to run, defaults to all
+    :param scale: scale in mm/px at full resolution
+    :param binning: downsample the frames like sensor binning
+    :param noise: standard deviation of the sensor noise in grey values
+    :param blur: sigma of the optical blur in px
+
+    :return: DataFrame with one row per case and configuration
+    """
+    if configurations is None:
+        configurations = list(CONFIGURATIONS)
+
+    rows = []
+    for surface_tension, apex_radius in CASES:
+        frames, truth = render_frames(
+            surface_tension=surface_tension,
+            apex_radius=apex_radius,
+            n_frames=n_frames,
+            scale=scale,
+            density=density,
+            binning=binning,
+            noise=noise,
+            blur=blur,
+        )
+        for name in configurations:
+            result = benchmark_configuration(
+                frames,
+                truth,
+                scale=scale * binning,
+                density=density,
+                **CONFIGURATIONS[name],
+            )
+            rows.append(
+                {
+                    "configuration": name,
+                    "surface tension (mN/m)": surface_tension,
+                    "resolution": f"{frames[0].shape[1]}x{frames[0].shape[0]}",
+                    **result,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def run_roi_shift_check(
+    configurations: list = None,
+    shifts: list = ROI_SHIFTS,
+    scale: float = 0.0027,
+    density: float = 0.998,
+):
+    """
+    Regression case for the ROI tracking: measure a drop, shift it sideways so it
+    runs out of the ROI and measure again. The analyzer has to fall back to the
+    full frame instead of measuring the part of the drop inside the ROI, so the
+    result is compared to a fresh analyzer measuring the shifted drop.
+
+    :return: DataFrame with the deviation after every shift, and whether it is
+        within ROI_SHIFT_TOLERANCE
+    """
+    if configurations is None:
+        configurations = list(CONFIGURATIONS)
+    surface_tension, apex_radius = CASES[0]
+
+    def render(centre, seed):
+        return render_pendant_drop(
+            surface_tension=surface_tension,
+            density=density,
+            scale=scale,
+            apex_radius=apex_radius,
+            needle_diameter=NEEDLE_DIAMETER,
+            centre=centre,
+            apex_height=1850,
+            seed=seed,
+        )
+
+    rows = []
+    for name in configurations:
+        for shift in shifts:
+            analyzer = PendantDropAnalysis(
+                scale=scale, density=density, **CONFIGURATIONS[name]
+            )
+            analyzer.measure(render(1224, seed=0)[0])
+            shifted = render(1224 + shift, seed=1)[0]
+            measurement = analyzer.measure(shifted)
+            reference = PendantDropAnalysis(
+                scale=scale, density=density, **CONFIGURATIONS[name]
+            ).measure(shifted)
+            deviation = 100 * (
+                measurement.surface_tension / reference.surface_tension - 1
+            )
+            rows.append(
+                {
+                    "configuration": name,
+                    "shift (px)": shift,
+                    "surface tension (mN/m)": measurement.surface_tension,
+                    "full frame (mN/m)": reference.surface_tension,
+                    "deviation (%)": deviation,
+                    "passed": abs(deviation) <= ROI_SHIFT_TOLERANCE,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pendant drop analysis on synthetic drops."
+    )
+    parser.add_argument("--frames", type=int, default=20, help="frames per case")
+    parser.add_argument(
+        "--configurations", nargs="+", default=None, choices=list(CONFIGURATIONS)
+    )
+    parser.add_argument("--binning", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=2.0)
+    parser.add_argument("--blur", type=float, default=1.0)
+    parser.add_argument("--output", default=None, help="csv file to save the results")
+    parser.add_argument(
+        "--roi-shift",
+        action="store_true",
+        help="only run the regression case of a drop moving out of the ROI",
+    )
+    args = parser.parse_args()
+
+    if args.roi_shift:
+        results = run_roi_shift_check(configurations=args.configurations)
+        print(results.round(3).to_string(index=False))
+        if not results["passed"].all():
+            raise SystemExit("ROI shift check failed")
+        return
+
+    results = run_benchmark(
+        n_frames=args.frames,
+        configurations=args.configurations,
+        binning=args.binning,
+        noise=args.noise,
+        blur=args.blur,
+    )
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(results.round(3).to_string(index=False))
+    if args.output is not None:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,30 +2,316 @@ import cv2
 import imutils
 import numpy as np
 import itertools
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from tkinter import Tk
 from scipy.spatial.distance import euclidean
 from tkinter.filedialog import askopenfilename
 import numpy as np
-from scipy.spatial import KDTree
 import cv2
 import itertools
 from scipy.spatial.distance import euclidean
 import os
 
+from analysis.young_laplace import YoungLaplaceFitter
 from utils.load_save_functions import load_settings
 from utils.logger import Logger
 
+GRAVITY_CONSTANT = 9.80665
+ST_WATER = 72.37  # mN/m, 22.5 degrees C, see https://srd.nist.gov/JPCRD/jpcrd231.pdf
+
+
+@dataclass(frozen=True)
+class PendantDropMeasurement:
+    """
+    Immutable result of analysing a single pendant drop frame.
+
+    de and ds are in pixels, surface tension in mN/m and scale (the scale that
+    would make this frame read as pure water) in mm/px. The bounding box is
+    (x, y, w, h) of the drop and timings holds the duration of each stage in s
+    (blur, edges, profile or contours, ds_search, and hin or young_laplace).
+    volume (uL) and fit_residual (px) are only set by the Young-Laplace engine.
+    outline, de_line and ds_line are only used to render the annotated image.
+    """
+
+    de: float
+    ds: float
+    S: float
+    Hin: float
+    surface_tension: float
+    scale: float
+    bounding_box: tuple
+    timings: dict
+    volume: float = None
+    fit_residual: float = None
+    outline: list = None
+    de_line: tuple = None
+    ds_line: tuple = None
+
+
+def _longest_run(indices):
+    """
+    Return first and last value of the longest run of consecutive integers in a
+    sorted array of indices.
+    """
+    if indices.size == 0:
+        raise ValueError("analysis: no drop edges found")
+    breaks = np.flatnonzero(np.diff(indices) > 1)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [indices.size - 1]))
+    longest = np.argmax(ends - starts)
+    return indices[starts[longest]], indices[ends[longest]]
+
+
+def _refine_edges(image, rows, columns, axis=1, window=3):
+    """
+    Sub-pixel edge positions from estimates at (rows, columns).
+
+    Looks for the strongest intensity gradient within +-window px of each estimate,
+    along the row (axis=1) or the column (axis=0), and fits a parabola through the
+    gradient magnitude around that maximum. Returns the refined column (axis=1) or
+    row (axis=0) of every estimate.
+    """
+    offsets = np.arange(-window - 1, window + 2)
+    if axis == 1:
+        positions = columns
+        samples = np.clip(columns[:, None] + offsets, 0, image.shape[1] - 1)
+        values = image[rows[:, None], samples]
+    else:
+        positions = rows
+        samples = np.clip(rows[:, None] + offsets, 0, image.shape[0] - 1)
+        values = image[samples, columns[:, None]]
+    values = values.astype(np.float32)
+
+    # central differences at offsets -window..window
+    gradient = np.abs(values[:, 2:] - values[:, :-2])
+    peak = np.clip(gradient.argmax(axis=1), 1, 2 * window - 1)
+    index = np.arange(peak.size)
+    g0 = gradient[index, peak - 1]
+    g1 = gradient[index, peak]
+    g2 = gradient[index, peak + 1]
+    curvature = g0 - 2 * g1 + g2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = np.where(curvature < 0, 0.5 * (g0 - g2) / curvature, 0)
+    delta = np.clip(delta, -0.5, 0.5)
+    return positions + (peak - window) + delta
+
+
+# piecewise correlation of 1/H with the shape factor S = ds / de
+_HIN_CORRELATION = [
+    (
+        lambda S: (S >= 0.3) & (S <= 0.4),
+        lambda S: (0.34074 / (S**2.52303))
+        + (123.9495 * (S**5))
+        - (72.82991 * (S**4))
+        + (0.01320 * (S**3))
+        - (3.38210 * (S**2))
+        + (5.52969 * (S))
+        - 1.07260,
+    ),
+    (
+        lambda S: (S > 0.4) & (S <= 0.46),
+        lambda S: (0.32720 / (S**2.56651))
+        - (0.97553 * (S**2))
+        + (0.84059 * S)
+        - (0.18069),
+    ),
+    (
+        lambda S: (S > 0.46) & (S <= 0.59),
+        lambda S: (0.31968 / (S**2.59725))
+        - (0.46898 * (S**2))
+        + (0.50059 * S)
+        - (0.13261),
+    ),
+    (
+        lambda S: (S > 0.59) & (S <= 0.68),
+        lambda S: (0.31522 / (S**2.62435))
+        - (0.11714 * (S**2))
+        + (0.15756 * S)
+        - (0.05285),
+    ),
+    (
+        lambda S: (S > 0.68) & (S <= 0.9),
+        lambda S: (0.31345 / (S**2.64267))
+        - (0.09155 * (S**2))
+        + (0.14701 * S)
+        - (0.05877),
+    ),
+    (
+        lambda S: (S > 0.9) & (S <= 1),
+        lambda S: (0.30715 / (S**2.84636))
+        - (0.69116 * (S**3))
+        + (1.08315 * (S**2))
+        - (0.18341 * S)
+        - (0.20970),
+    ),
+]
+S_MIN = 0.3
+S_MAX = 1
+
+
+def calculate_Hin(S):
+    """
+    Evaluate 1/H for a shape factor or an array of shape factors.
+
+    Shape factors outside S_MIN <= S <= S_MAX give NaN. A scalar S returns a float,
+    an array returns an array of the same shape.
+    """
+    S_array = np.asarray(S, dtype=float)
+    Hin = np.piecewise(
+        S_array,
+        [condition(S_array) for condition, _ in _HIN_CORRELATION],
+        [function for _, function in _HIN_CORRELATION] + [np.nan],
+    )
+    if Hin.ndim == 0:
+        return float(Hin)
+    return Hin
+
+
+class HinTable:
+    """
+    Precomputed 1/H table that converts many shape factors at once by linear
+    interpolation, for batch and offline analysis.
+
+    :param n_points: number of tabulated shape factors between S_MIN and S_MAX
+    :param out_of_range: what to do with shape factors outside S_MIN..S_MAX,
+        "nan" returns NaN, "clip" uses the nearest tabulated value and "raise"
+        raises a ValueError
+    """
+
+    def __init__(self, n_points=10000, out_of_range="nan"):
+        if out_of_range not in ("nan", "clip", "raise"):
+            raise ValueError(f"analysis: unknown out of range handling {out_of_range}")
+        self.out_of_range = out_of_range
+        self.S = np.linspace(S_MIN, S_MAX, n_points)
+        self.Hin = calculate_Hin(self.S)
+
+    def __call__(self, S):
+        S = np.asarray(S, dtype=float)
+        out_of_range = ~((S >= S_MIN) & (S <= S_MAX))
+        if self.out_of_range == "raise" and out_of_range.any():
+            raise ValueError(
+                f"analysis: {np.count_nonzero(out_of_range)} shape factors out of bounds"
+            )
+        Hin = np.interp(S, self.S, self.Hin)
+        if self.out_of_range == "nan":
+            Hin = np.where(out_of_range, np.nan, Hin)
+        if Hin.ndim == 0:
+            return float(Hin)
+        return Hin
+
+
+def calculate_surface_tension(de, ds, scale, density, hin_table=None):
+    """
+    Surface tension in mN/m from de and ds in pixels, for scalars or arrays.
+
+    :param scale: scale in mm/px
+    :param density: density in g/mL
+    :param hin_table: optional HinTable, the correlation is evaluated directly otherwise
+    """
+    de = np.asarray(de, dtype=float)
+    S = np.asarray(ds, dtype=float) / de
+    Hin = calculate_Hin(S) if hin_table is None else hin_table(S)
+    return density * GRAVITY_CONSTANT * (de * scale) ** 2 * Hin
+
+
+class BufferPool:
+    """
+    Image buffers that are reused from frame to frame, so that analysing a frame
+    allocates no images. Buffers hold a full frame, the image of a smaller ROI
+    uses the start of a buffer so it stays contiguous (numpy reductions along
+    the rows of a strided view copy it first).
+    """
+
+    def __init__(self, frame_shape=None):
+        """
+        :param frame_shape: (height, width) of the camera frames to allocate for,
+            otherwise buffers are allocated at the size of the first image
+        """
+        self.frame_shape = frame_shape
+        self.buffers = {}
+
+    def get(self, name: str, shape: tuple, dtype=np.uint8):
+        """
+        Contiguous image of the given shape in a named buffer, the buffer is only
+        reallocated when the image does not fit.
+        """
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            if self.frame_shape is not None:
+                size_alloc = max(size, int(np.prod(self.frame_shape)))
+            else:
+                size_alloc = size
+            buffer = np.empty(size_alloc, dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+
+# pre-screening of frames on a coarse grid before the full analysis
+PRESCREEN_STEP = 8  # take every 8th pixel in both directions
+PRESCREEN_MIN_EDGE_PIXELS = 20
+PRESCREEN_MAX_EDGE_FRACTION = 0.1
+PRESCREEN_MIN_BULGE = 1.2  # minimum ratio of the drop width to the needle width
+ROI_BORDER_MARGIN = 1  # px, edges this close to the ROI border count as touching it
+
 
 class PendantDropAnalysis:
-    def __init__(self):
+    def __init__(
+        self,
+        method="contour",
+        engine="selected_plane",
+        track_roi=True,
+        roi_padding=100,
+        subpixel=True,
+        scale=None,
+        density=None,
+        frame_shape=None,
+    ):
+        """
+        :param method: "contour" uses the original contour based search, the
+            stored SCALE is calibrated against it; "profile" reads de and ds from
+            the row-wise drop edges and is more accurate, calibrate SCALE again
+            when switching to it
+        :param engine: "selected_plane" calculates the surface tension from de, ds
+            and 1/H, "young_laplace" fits the whole drop profile (profile method only)
+        :param track_roi: only process a padded region around the drop found in
+            the previous frame, falling back to the full frame when it is lost
+        :param roi_padding: padding in pixels around the drop bounding box
+        :param subpixel: refine the drop edges of the profile method to sub-pixel
+            precision, so binned or cropped frames keep their precision
+        :param scale: scale in mm/px, defaults to SCALE from the settings
+        :param density: density in g/mL, defaults to DENSITY from the settings
+        :param frame_shape: (height, width) of the frames, to allocate the image
+            buffers up front instead of on the first frame
+        """
+        if method not in ("profile", "contour"):
+            raise ValueError(f"analysis: unknown method {method}")
+        self.method = method
+        if engine not in ("selected_plane", "young_laplace"):
+            raise ValueError(f"analysis: unknown engine {engine}")
+        if engine == "young_laplace" and method != "profile":
+            raise ValueError("analysis: the young_laplace engine needs the profile method")
+        self.engine = engine
+        self.young_laplace = YoungLaplaceFitter() if engine == "young_laplace" else None
         self.settings = load_settings()
-        self.density = float(self.settings["DENSITY"])
-        self.scale = float(self.settings["SCALE"])
-        self.gravity_constant = 9.80665
+        self.density = float(density if density is not None else self.settings["DENSITY"])
+        self.scale = float(scale if scale is not None else self.settings["SCALE"])
+        self.gravity_constant = GRAVITY_CONSTANT
         self.file_path = None
         self.raw_image = None
         self.processed_image = None
         self.analysis_image = None
+        self.measurement = None
+        self.track_roi = track_roi
+        self.roi_padding = roi_padding
+        self.roi = None  # (x0, y0, x1, y1) of the region processed in the next frame
+        self.roi_offset = (0, 0)
+        self.subpixel = subpixel
+        self.blurred_image = None
+        self.timings = {}  # stage -> duration in s of the current frame
+        self.buffers = BufferPool(frame_shape)
 
     def init_logger(self):
         self.logger = Logger(
@@ -52,47 +338,225 @@ class PendantDropAnalysis:
 
     def process_image(self):
 
-        blur = cv2.GaussianBlur(self.raw_image, (9, 9), 0)
-        canny = cv2.Canny(blur, 10, 10)
-        edged = cv2.dilate(canny, None, iterations=1)
-        self.processed_image = cv2.erode(edged, None, iterations=1)
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            image = self.raw_image[y0:y1, x0:x1]
+            self.roi_offset = (x0, y0)
+        else:
+            image = self.raw_image
+            self.roi_offset = (0, 0)
+
+        # the drop is backlit, all processing runs on a single channel
+        # all images are written into reused buffers of the buffer pool
+        shape = image.shape[:2]
+        with self._timed("blur"):
+            if image.ndim == 3:
+                image = cv2.cvtColor(
+                    image, cv2.COLOR_BGR2GRAY, dst=self.buffers.get("gray", shape)
+                )
+            blur = cv2.GaussianBlur(
+                image, (9, 9), 0, dst=self.buffers.get("blurred", shape)
+            )
+        self.blurred_image = blur
+        with self._timed("edges"):
+            edges = self.buffers.get("edges", shape)
+            dilated = self.buffers.get("dilated", shape)
+            cv2.Canny(blur, 10, 10, edges=edges)
+            cv2.dilate(edges, None, dst=dilated, iterations=1)
+            self.processed_image = cv2.erode(dilated, None, dst=edges, iterations=1)
+
+    @contextmanager
+    def _timed(self, stage: str):
+        """
+        Add the duration of a block to the timing of a stage, a stage that runs
+        twice in a frame (after losing the ROI) is counted twice.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = (
+                self.timings.get(stage, 0.0) + time.perf_counter() - start
+            )
 
     def analyse(self):
+        if self.method == "profile":
+            self._analyse_profile()
+        else:
+            self._analyse_contour()
+
+        S = self.ds / self.de
+        self.S = S
+        self.volume = None
+        self.fit_residual = None
+        if self.engine == "young_laplace":
+            with self._timed("young_laplace"):
+                self.Hin = calculate_Hin(S)
+                self._fit_young_laplace()
+            return self.surface_tension
+
+        with self._timed("hin"):
+            Hin = self._calculate_Hin(S)
+        self.Hin = Hin
+        de_scaled = self.de * self.scale  # pixels -> mm
+        surface_tension = self.density * self.gravity_constant * (de_scaled**2) * Hin
+        self.surface_tension = surface_tension
+        return surface_tension
 
-        # some constants
-        text_y_offset = 100
+    def _fit_young_laplace(self):
+        rows, left, right, apex = self.profile
+        widths = right - left
+
+        # the needle is not part of the drop, only fit the rows below the neck
+        equator = np.argmax(widths)
+        above_equator = widths[: equator + 1]
+        neck = np.flatnonzero(above_equator <= 1.02 * above_equator.min())[-1]
+        heights = apex - rows[neck:]
+        radii = widths[neck:] / 2
+        # with sub-pixel edges the apex can lie above the centre of the last row
+        radii = radii[heights > 0]
+        heights = heights[heights > 0]
+
+        fit = self.young_laplace.fit(heights, radii)
+        b_scaled = fit["apex_radius"] * self.scale  # pixels -> mm
+        self.surface_tension = (
+            self.density * self.gravity_constant * b_scaled**2 / fit["bond_number"]
+        )
+        self.volume = self.young_laplace.volume(fit, heights[0]) * self.scale**3  # mm^3 = uL
+        self.fit_residual = fit["residual"]
+
+    def extract_profile(self):
+        """
+        Find the left and right edge of the drop in every row of the processed image.
+
+        Returns the row indices (from the top of the needle down to the apex), the
+        left and right boundary of the drop in each of these rows and the height
+        of the apex, in coordinates of the full frame. With subpixel the boundaries
+        are refined on the blurred image, otherwise they are the outer sides of
+        the edge pixels.
+        """
+        x_offset, y_offset = self.roi_offset
+        edges = self.processed_image  # 0 or 255
+
+        # every column spanned by the drop crosses its outline, so the drop is the
+        # longest run of columns with edges; this drops specks next to the drop
+        col_start, col_end = _longest_run(np.flatnonzero(edges.any(axis=0)))
+        mask = self.buffers.get("mask", edges.shape)
+        np.copyto(mask, edges)
+        mask[:, :col_start] = 0
+        mask[:, col_end + 1 :] = 0
+
+        # needle and drop form the longest run of rows with edges
+        row_start, row_end = _longest_run(np.flatnonzero(mask.any(axis=1)))
+        # whole-pixel extent of the edges, the sub-pixel boundaries lie inside it
+        self.edge_box = (
+            col_start + x_offset,
+            row_start + y_offset,
+            col_end - col_start + 1,
+            row_end - row_start + 1,
+        )
 
-        # Find contours on processed image
-        contours = imutils.grab_contours(
-            cv2.findContours(
-                image=self.processed_image.copy(),
-                mode=cv2.RETR_EXTERNAL,
-                method=cv2.CHAIN_APPROX_SIMPLE,
+        # first edge pixel from the left, and from the right in a mirrored copy,
+        # argmax over whole contiguous rows does not copy the mask
+        rows = np.arange(row_start, row_end + 1)
+        left = mask[row_start : row_end + 1].argmax(axis=1)
+        mirrored = cv2.flip(mask, 1, dst=self.buffers.get("mirrored", edges.shape))
+        right = mask.shape[1] - 1 - mirrored[row_start : row_end + 1].argmax(axis=1)
+
+        if self.subpixel:
+            apex_column = np.array([(left[-1] + right[-1]) // 2])
+            apex = _refine_edges(
+                self.blurred_image, np.array([row_end]), apex_column, axis=0
+            )[0]
+            left = _refine_edges(self.blurred_image, rows, left)
+            right = _refine_edges(self.blurred_image, rows, right)
+        else:
+            left = left - 0.5
+            right = right + 0.5
+            apex = row_end + 0.5
+
+        return rows + y_offset, left + x_offset, right + x_offset, apex + y_offset
+
+    def _analyse_profile(self):
+        with self._timed("profile"):
+            rows, left, right, apex = self.extract_profile()
+        self.profile = (rows, left, right, apex)
+        with self._timed("ds_search"):
+            self._find_diameters(rows, left, right, apex)
+
+    def _find_diameters(self, rows, left, right, apex):
+        widths = right - left
+
+        # de is the widest row, ds the width at a distance de above the apex
+        equator = np.argmax(widths)
+        de = float(widths[equator])
+        ds_height = apex - de
+        if ds_height < rows[0]:
+            raise ValueError("analysis: drop is shorter than its equatorial diameter")
+        ds = float(np.interp(ds_height, rows, widths))
+        ds_index = int(round(ds_height)) - rows[0]
+
+        self.de = de
+        self.ds = ds
+        x = int(np.floor(left.min()))
+        self.bounding_box = (
+            x,
+            int(rows[0]),
+            int(np.ceil(right.max())) - x,
+            int(np.ceil(apex)) - int(rows[0]),
+        )
+        self.outline = [
+            np.concatenate(
+                (
+                    np.column_stack((left, rows)),
+                    np.column_stack((right, rows))[::-1],
+                )
             )
+            .round()
+            .reshape(-1, 1, 2)
+            .astype(np.int32)
+        ]
+        self.de_line = (
+            (int(round(left[equator])), int(rows[equator])),
+            (int(round(right[equator])), int(rows[equator])),
         )
+        self.ds_line = (
+            (int(round(left[ds_index])), int(rows[ds_index])),
+            (int(round(right[ds_index])), int(rows[ds_index])),
+        )
+
+    def _analyse_contour(self):
+
+        # Find contours on processed image
+        with self._timed("contours"):
+            contours = imutils.grab_contours(
+                cv2.findContours(
+                    image=self.processed_image,
+                    mode=cv2.RETR_EXTERNAL,
+                    method=cv2.CHAIN_APPROX_SIMPLE,
+                    offset=self.roi_offset,
+                )
+            )
+        with self._timed("ds_search"):
+            self._find_diameters_contour(contours)
+
+    def _find_diameters_contour(self, contours):
 
         # Sort contours by the width of the bounding box in descending order
         # Keep only the broadest contour which should be the droplet
         longest_contour = sorted(
             contours, key=lambda c: cv2.boundingRect(c)[2], reverse=True
         )[0]
-
-        # Draw the longest contour on the original image
-        self.analysis_image = self.raw_image.copy()
-        cv2.drawContours(
-            image=self.analysis_image,
-            contours=[longest_contour],
-            contourIdx=-1,
-            color=(252, 3, 103),
-            thickness=10,
-        )
+        self.outline = [longest_contour]
 
         # Find the bounding rectangle for the contour + De calculated
         x, y, w, h = cv2.boundingRect(longest_contour)
         de = w  #! important for calculation st
         self.de = de
+        self.bounding_box = (x, y, w, h)
+        self.edge_box = self.bounding_box
 
-        # Draw arrowline + De
+        # De line through the left touching point
         touching_points_left = []
         for point in longest_contour:
             px, py = point[0]
@@ -100,43 +564,24 @@ class PendantDropAnalysis:
                 touching_points_left.append(point[0])
         left_pt_de_line = (touching_points_left[0][0], touching_points_left[0][1])
         right_pt_de_line = (touching_points_left[0][0] + w, touching_points_left[0][1])
-        cv2.arrowedLine(
-            img=self.analysis_image,
-            pt1=left_pt_de_line,
-            pt2=right_pt_de_line,
-            color=(255, 127, 14),
-            thickness=10,
-        )
-        cv2.arrowedLine(
-            img=self.analysis_image,
-            pt1=right_pt_de_line,
-            pt2=left_pt_de_line,
-            color=(255, 127, 14),
-            thickness=10,
-        )
-        cv2.putText(
-            img=self.analysis_image,
-            text=f"de={de:.0f}px",
-            org=(left_pt_de_line[0], left_pt_de_line[1] + text_y_offset),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=2,
-            color=(255, 127, 14),
-            thickness=3,
-        )
+        self.de_line = (left_pt_de_line, right_pt_de_line)
+
         # Compute the coordinates of the rectangle corners
         top_left = (x, y)
         top_right = (x + w, y)
         bottom_right = (x + w, y + h)
         bottom_left = (x, y + h)
 
-        # Create new blank image to redraw biggest contour and crop above the ds
-        cropped_image = np.zeros_like(self.raw_image)
-        cv2.drawContours(cropped_image, [longest_contour], -1, (0, 255, 0), thickness=10)
-        cropped_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2GRAY)
-        cropped_image = cropped_image[
-            int(top_left[1]) : int(bottom_left[1] - (de)),
-            int(top_left[0]) : int(top_right[0]),
-        ]
+        # Redraw biggest contour on a reused canvas and crop above the ds, only
+        # the cropped part is read so only that part has to be blank
+        canvas = self.buffers.get("canvas", self.raw_image.shape[:2])
+        crop = (
+            slice(int(top_left[1]), int(bottom_left[1] - (de))),
+            slice(int(top_left[0]), int(top_right[0])),
+        )
+        canvas[crop] = 0
+        cv2.drawContours(canvas, [longest_contour], -1, 255, thickness=10)
+        cropped_image = canvas[crop]
         # find new contours in cropped image
         cnts_2, _ = cv2.findContours(
             cropped_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
@@ -154,8 +599,9 @@ class PendantDropAnalysis:
         Lx, Ly, Lw, Lh = cv2.boundingRect(contourleft)
         Rx, Ry, Rw, Rh = cv2.boundingRect(contourright)
         ds = Rx + Rw - Lx  # This assumes the contours are ordered left to right
+        self.ds = ds
 
-        # Draw the line for the maximum distance
+        # Line for the maximum distance
         Lx_adjusted, Ly_adjusted = Lx + top_left[0], Ly + top_left[1]
         Rx_adjusted, Ry_adjusted = Rx + top_left[0], Ry + top_left[1]
 
@@ -165,138 +611,233 @@ class PendantDropAnalysis:
         new_y_position = max(
             new_y_left, new_y_right
         )  # Use the lower of the two for drawing
-
-        # # Adjust the drawing of the maximum distance line and text with the new Y-coordinate
-        cv2.arrowedLine(
-            self.analysis_image,
+        self.ds_line = (
             (Lx_adjusted, new_y_position),  # Use new Y-coordinate for left contour
             (
                 Rx_adjusted + Rw,
                 new_y_position,
             ),  # Use new Y-coordinate for right contour, ensuring line is horizontal
+        )
+
+    def annotate(self, measurement=None, image=None):
+        """
+        Draw the drop outline, the de and ds lines and the surface tension on a
+        copy of the image. Only needed for display, measuring does not render.
+
+        :param measurement: PendantDropMeasurement to draw, defaults to the last one
+        :param image: image the measurement belongs to, defaults to the raw image
+        """
+        if measurement is None:
+            measurement = self.measurement
+        if image is None:
+            image = self.raw_image
+
+        # some constants
+        text_y_offset = 100
+
+        # Draw the outline of the drop on the original image, in colour
+        if image.ndim == 2:
+            self.analysis_image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        else:
+            self.analysis_image = image.copy()
+        cv2.drawContours(
+            image=self.analysis_image,
+            contours=measurement.outline,
+            contourIdx=-1,
+            color=(252, 3, 103),
+            thickness=10,
+        )
+
+        # Draw arrowline + De
+        left_pt_de_line, right_pt_de_line = measurement.de_line
+        cv2.arrowedLine(
+            img=self.analysis_image,
+            pt1=left_pt_de_line,
+            pt2=right_pt_de_line,
+            color=(255, 127, 14),
+            thickness=10,
+        )
+        cv2.arrowedLine(
+            img=self.analysis_image,
+            pt1=right_pt_de_line,
+            pt2=left_pt_de_line,
+            color=(255, 127, 14),
+            thickness=10,
+        )
+        cv2.putText(
+            img=self.analysis_image,
+            text=f"de={measurement.de:.0f}px",
+            org=(left_pt_de_line[0], left_pt_de_line[1] + text_y_offset),
+            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale=2,
+            color=(255, 127, 14),
+            thickness=3,
+        )
+
+        # Draw arrowline + Ds
+        left_pt_ds_line, right_pt_ds_line = measurement.ds_line
+        cv2.arrowedLine(
+            self.analysis_image,
+            left_pt_ds_line,
+            right_pt_ds_line,
             (31, 119, 180),  # Color for distinction
             thickness=10,
         )
         cv2.arrowedLine(
             self.analysis_image,
-            (
-                Rx_adjusted + Rw,
-                new_y_position,
-            ),
-            (Lx_adjusted, new_y_position),  # Use new Y-coordinate for left contour
+            right_pt_ds_line,
+            left_pt_ds_line,
             (31, 119, 180),  # Color for distinction
             thickness=10,
         )
-
-        # # Adjust the text position to be slightly above or below the line
         cv2.putText(
             self.analysis_image,
-            f"ds={ds:.0f}px",
-            (Lx_adjusted, new_y_position + text_y_offset),  # Adjusted for visibility
+            f"ds={measurement.ds:.0f}px",
+            (left_pt_ds_line[0], left_pt_ds_line[1] + text_y_offset),
             cv2.FONT_HERSHEY_SIMPLEX,
             fontScale=2,
             color=(31, 119, 180),  # Color for distinction
             thickness=3,
         )
 
-        left_visual = contourleft.copy()
-        left_visual[:, :, 0] += x
-
-        right_visual = contourright.copy()
-        right_visual[:, :, 0] += x
-
-        S = ds / de
-        Hin = self._calculate_Hin(S)
-        self.Hin = Hin
-        de_scaled = de * self.scale # pixels -> mm
-        surface_tension = self.density * self.gravity_constant * (de_scaled**2) * Hin
-
         # Draw the surface_tension on the visual_image
         cv2.putText(
             self.analysis_image,
-            f"surface_tension: {surface_tension:.2f} mN/m",
+            f"surface_tension: {measurement.surface_tension:.2f} mN/m",
             (10, self.analysis_image.shape[0] - 10),
             cv2.FONT_HERSHEY_SIMPLEX,
             2,
             (0, 0, 0),
             2,
         )
-
-        return surface_tension
+        return self.analysis_image
 
     def _calculate_Hin(self, S):
-        if not (0.3 < S < 1):
-            # self.logger.error("analysis: shape factor S is out of bounds")
-            pass
-
-        # find value for 1/H for different values of S
-        if (S >= 0.3) and (S <= 0.4):
-            Hin = (
-                (0.34074 / (S**2.52303))
-                + (123.9495 * (S**5))
-                - (72.82991 * (S**4))
-                + (0.01320 * (S**3))
-                - (3.38210 * (S**2))
-                + (5.52969 * (S))
-                - 1.07260
-            )
-        if (S > 0.4) and (S <= 0.46):
-            Hin = (
-                (0.32720 / (S**2.56651))
-                - (0.97553 * (S**2))
-                + (0.84059 * S)
-                - (0.18069)
-            )
-        if (S > 0.46) and (S <= 0.59):
-            Hin = (
-                (0.31968 / (S**2.59725))
-                - (0.46898 * (S**2))
-                + (0.50059 * S)
-                - (0.13261)
-            )
-        if (S > 0.59) and (S <= 0.68):
-            Hin = (
-                (0.31522 / (S**2.62435))
-                - (0.11714 * (S**2))
-                + (0.15756 * S)
-                - (0.05285)
-            )
-        if (S > 0.68) and (S <= 0.9):
-            Hin = (
-                (0.31345 / (S**2.64267))
-                - (0.09155 * (S**2))
-                + (0.14701 * S)
-                - (0.05877)
-            )
-        if (S > 0.9) and (S <= 1):
-            Hin = (
-                (0.30715 / (S**2.84636))
-                - (0.69116 * (S**3))
-                + (1.08315 * (S**2))
-                - (0.18341 * S)
-                - (0.20970)
-            )
+        Hin = calculate_Hin(S)
+        if np.isnan(Hin):
+            raise ValueError(f"analysis: shape factor S={S:.3f} is out of bounds")
         return Hin
 
-    def image2st(self, img):
-        self.init_logger()
-        self.raw_image = img    
+    def measure(self, img):
+        """
+        Analyse a frame once and return a PendantDropMeasurement, from which both
+        the surface tension and the calibration scale can be read.
+        """
+        self.raw_image = img
+        self.timings = {}
         self.process_image()
-        st = self.analyse()
-        return st, self.analysis_image
+        try:
+            self.analyse()
+            if self.roi is not None and self._touches_roi_border():
+                raise ValueError("analysis: drop reached the border of the ROI")
+        except Exception:
+            if self.roi is None:
+                raise
+            # drop lost or moved out of the ROI, search the full frame again
+            self.roi = None
+            self.process_image()
+            self.analyse()
+        self._update_roi()
+
+        # surface tension scales with the square of the scale for both engines
+        self.measurement = PendantDropMeasurement(
+            de=self.de,
+            ds=self.ds,
+            S=self.S,
+            Hin=self.Hin,
+            surface_tension=self.surface_tension,
+            scale=float(self.scale * np.sqrt(ST_WATER / self.surface_tension)),
+            bounding_box=self.bounding_box,
+            volume=self.volume,
+            fit_residual=self.fit_residual,
+            timings=dict(self.timings),
+            outline=self.outline,
+            de_line=self.de_line,
+            ds_line=self.ds_line,
+        )
+        return self.measurement
+
+    def prescreen(self, img):
+        """
+        Check on a coarse grid of the frame whether it is worth analysing, which
+        takes a fraction of the full analysis. Frames without a drop come by
+        while the drop is formed, after it detached and between retries.
+
+        :return: None if the frame may hold a pendant drop, otherwise the reason
+            to skip it: "no_drop" (no dark object), "edges" (too few or too many
+            edges, out of focus or not backlit), "needle_only" (nothing wider than
+            the needle) or "cut_off" (the drop runs out of the bottom of the frame)
+        """
+        small = img[::PRESCREEN_STEP, ::PRESCREEN_STEP]
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        # the backlight fills most of the frame, the needle and drop are dark
+        background = np.percentile(small, 90)
+        dark = small < 0.5 * background
+        dark_rows = np.flatnonzero(dark.any(axis=1))
+        if dark_rows.size < 2:
+            return "no_drop"
+
+        edge_pixels = np.count_nonzero(cv2.Canny(small, 50, 100))
+        if (
+            edge_pixels < PRESCREEN_MIN_EDGE_PIXELS
+            or edge_pixels > PRESCREEN_MAX_EDGE_FRACTION * small.size
+        ):
+            return "edges"
+
+        if dark[-1].any():
+            return "cut_off"
+
+        # intensity profile: width of the dark object in every row, the needle
+        # enters at the top and a drop bulges out below it
+        rows = dark[dark_rows]
+        widths = rows.shape[1] - rows[:, ::-1].argmax(axis=1) - rows.argmax(axis=1)
+        needle_width = np.median(widths[: max(dark_rows.size // 10, 1)])
+        if widths.max() < PRESCREEN_MIN_BULGE * needle_width:
+            return "needle_only"
+        return None
+
+    def _touches_roi_border(self):
+        """
+        Check if the drop touches an edge of the ROI that is not also an edge of
+        the frame, in which case part of the drop may lie outside the ROI.
+
+        Tested on the whole-pixel edges: the sub-pixel boundaries of a drop cut
+        off by the ROI lie a few pixels inside the ROI border.
+        """
+        x0, y0, x1, y1 = self.roi
+        height, width = self.raw_image.shape[:2]
+        x, y, w, h = self.edge_box
+        margin = ROI_BORDER_MARGIN
+        return (
+            (x <= x0 + margin and x0 > 0)
+            or (y <= y0 + margin and y0 > 0)
+            or (x + w >= x1 - margin and x1 < width)
+            or (y + h >= y1 - margin and y1 < height)
+        )
 
-    def image2scale(self, img):
-        # surface_tension = self.density * self.gravity_constant * (de_scaled**2) * Hin
-        self.init_logger()
-        self.raw_image = img    
-        self.process_image()
-        st = self.analyse()
-        st_water = (
-            72.37  # mN/m, 22.5 degrees C, see https://srd.nist.gov/JPCRD/jpcrd231.pdf
+    def _update_roi(self):
+        if not self.track_roi:
+            return
+        height, width = self.raw_image.shape[:2]
+        x, y, w, h = self.bounding_box
+        self.roi = (
+            max(x - self.roi_padding, 0),
+            max(y - self.roi_padding, 0),
+            min(x + w + self.roi_padding, width),
+            min(y + h + self.roi_padding, height),
         )
-        de_scaled = np.sqrt(st_water / (self.density * self.gravity_constant * self.Hin))
-        scale = de_scaled / self.de
-        return scale
+
+    def reset_roi(self):
+        self.roi = None
+
+    def image2st(self, img):
+        measurement = self.measure(img)
+        return measurement.surface_tension, self.annotate(measurement)
+
+    def image2scale(self, img):
+        return self.measure(img).scale
 
     def show_raw_image(self):
         cv2.imshow(winname=self.file_path, mat=self.raw_image)
@@ -0,0 +1,285 @@
+"""
+Offline re-analysis of the droplet images archived by PendantDropCamera.
+
+Runs PendantDropAnalysis over the frames archived in
+experiments/<name>/data/<well>/images/, either a frame archive droplet_<n>.frames
+or image files in droplet_<n>/, in a process pool, regenerates dynamic_surface_tension.csv for every well and
+updates the equilibrium surface tension in results.csv. The analysis settings
+default to the ones the experiment was run with, from its meta data. Run from
+the repository root, e.g. after correcting the scale or density of an experiment:
+
+    python -m analysis.reanalysis <experiment name> --scale 0.00271 --processes 8
+"""
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+from analysis.image_analysis import (
+    PendantDropAnalysis,
+    HinTable,
+    calculate_surface_tension,
+)
+from hardware.archive import FrameArchive
+from utils.load_save_functions import (
+    load_settings_meta_data,
+    save_dynamic_surface_tension,
+    update_results_surface_tension,
+)
+from utils.logger import Logger
+from utils.utils import calculate_equillibrium_value_in_window
+
+CHUNK_SIZE = 50  # consecutive frames per task, so the ROI tracking carries over
+IMAGE_EXTENSIONS = (".png", ".jpg", ".npy")  # codecs of ImageArchiver
+
+_analyzer = None  # one analyzer per worker process
+_archives = {}  # frame archives opened by a worker process
+
+
+def _init_worker(method: str, engine: str, scale: float, density: float):
+    global _analyzer
+    cv2.setNumThreads(1)  # parallelism comes from the processes
+    _analyzer = PendantDropAnalysis(
+        method=method, engine=engine, scale=scale, density=density
+    )
+
+
+def _read_frame(frame):
+    file_path, index = frame
+    if index is None:
+        return read_image(file_path)
+    if file_path not in _archives:
+        _archives[file_path] = FrameArchive(file_path)
+    return np.asarray(_archives[file_path][index])
+
+
+def _analyse_frames(frames: list):
+    """
+    Return de and ds (in px) and the surface tension (mN/m) of every frame, NaN
+    where no drop was found.
+    """
+    diameters = []
+    for frame in frames:
+        try:
+            img = _read_frame(frame)
+            if _analyzer.prescreen(img) is not None:
+                diameters.append((np.nan, np.nan, np.nan))
+                continue
+            measurement = _analyzer.measure(img)
+            diameters.append(
+                (measurement.de, measurement.ds, measurement.surface_tension)
+            )
+        except Exception:
+            diameters.append((np.nan, np.nan, np.nan))
+    return diameters
+
+
+def _droplet_number(path: str):
+    return int(os.path.splitext(os.path.basename(path))[0].rsplit("_", 1)[-1])
+
+
+def find_droplet_frames(experiment_name: str):
+    """
+    Collect the frames of the last droplet of every well in an experiment. Earlier
+    droplets of a well are retries, the last one is the droplet that was measured.
+
+    :param experiment_name: Experiment name
+
+    :return: Dictionary of well id -> (frames, times), frames is a list of
+        (file path, index in the frame archive or None for an image file) and
+        times the time of every frame in s since the first one
+    """
+    data_dir = f"experiments/{experiment_name}/data"
+    droplet_frames = {}
+    for well_id in sorted(os.listdir(data_dir)):
+        droplets = [
+            path
+            for path in glob.glob(f"{data_dir}/{well_id}/images/droplet_*")
+            if os.path.isdir(path) or path.endswith(".frames")
+        ]
+        if not droplets:
+            continue
+        last_droplet = max(droplets, key=_droplet_number)
+
+        if last_droplet.endswith(".frames"):
+            # frame archive, timed on the camera clock
+            archive = FrameArchive(last_droplet)
+            frames = [(last_droplet, i) for i in range(len(archive))]
+            timestamps = archive.index["timestamp (s)"].to_numpy()
+            times = timestamps - timestamps[0] if len(timestamps) else timestamps
+        else:
+            file_paths = sorted(
+                file_path
+                for extension in IMAGE_EXTENSIONS
+                for file_path in glob.glob(f"{last_droplet}/*{extension}")
+            )
+            frames = [(file_path, None) for file_path in file_paths]
+            times = [
+                (image_time(file_path) - image_time(file_paths[0])).total_seconds()
+                for file_path in file_paths
+            ]
+        if frames:
+            droplet_frames[well_id] = (frames, np.asarray(times, dtype=float))
+    return droplet_frames
+
+
+def image_time(file_path: str):
+    """
+    Time stamp encoded in the file name by ImageArchiver, %Y%m%d_%H%M%S_%f
+    (older archives have no microseconds).
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    date, time, *microseconds = name.split("_")
+    time_stamp = datetime.strptime(f"{date}_{time}", "%Y%m%d_%H%M%S")
+    if microseconds:
+        time_stamp += timedelta(microseconds=int(microseconds[0]))
+    return time_stamp
+
+
+def read_image(file_path: str):
+    """Read an archived image, .npy files are written by the raw codec."""
+    if file_path.endswith(".npy"):
+        return np.load(file_path)
+    return cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+
+
+def reanalyse_experiment(
+    experiment_name: str,
+    scale: float = None,
+    density: float = None,
+    processes: int = None,
+    method: str = None,
+    engine: str = None,
+    eq_time_window: float = None,
+):
+    """
+    Re-analyse all archived droplet frames of an experiment. The analysis
+    defaults to the settings stored with the experiment, so the results are
+    comparable to the ones measured during the experiment.
+
+    :param experiment_name: Experiment name
+    :param scale: Scale in mm/px, defaults to the scale stored with the experiment
+    :param density: Density in g/mL, defaults to the density stored with the experiment
+    :param processes: Number of worker processes, defaults to the number of cores
+    :param method: Analysis method of PendantDropAnalysis, defaults to
+        ANALYSIS_METHOD of the experiment
+    :param engine: Analysis engine of PendantDropAnalysis, defaults to
+        ANALYSIS_ENGINE of the experiment
+    :param eq_time_window: Last seconds of the measurement averaged for the
+        equilibrium value, defaults to EQUILIBRIUM_WINDOW of the experiment
+
+    :return: Dictionary of well id -> equilibrium surface tension
+    """
+    logger = Logger(
+        name="reanalysis",
+        file_path=f"experiments/{experiment_name}/meta_data",
+    )
+    settings = load_settings_meta_data(experiment_name)
+    scale = float(scale if scale is not None else settings["SCALE"])
+    density = float(density if density is not None else settings["DENSITY"])
+    # experiments from before these settings were run with their defaults
+    if method is None:
+        method = settings.get("ANALYSIS_METHOD", "contour")
+    if engine is None:
+        engine = settings.get("ANALYSIS_ENGINE", "selected_plane")
+    if eq_time_window is None:
+        eq_time_window = float(settings.get("EQUILIBRIUM_WINDOW", 10))
+
+    droplet_frames = find_droplet_frames(experiment_name)
+    tasks = [
+        (well_id, frames[i : i + CHUNK_SIZE])
+        for well_id, (frames, _) in droplet_frames.items()
+        for i in range(0, len(frames), CHUNK_SIZE)
+    ]
+    logger.info(
+        f"Re-analysing {sum(len(f) for f, _ in droplet_frames.values())} frames of "
+        f"{len(droplet_frames)} wells (scale {scale} mm/px, density {density} g/mL, "
+        f"method {method}, engine {engine}, equilibrium over {eq_time_window} s)."
+    )
+
+    diameters = {well_id: [] for well_id in droplet_frames}
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(method, engine, scale, density),
+    ) as executor:
+        chunk_results = executor.map(_analyse_frames, [chunk for _, chunk in tasks])
+        for (well_id, _), result in zip(tasks, chunk_results):
+            diameters[well_id].extend(result)
+
+    hin_table = HinTable(out_of_range="nan")
+    surface_tensions_eq = {}
+    for well_id, (_, times) in droplet_frames.items():
+        de, ds, surface_tensions = np.array(diameters[well_id]).reshape(-1, 3).T
+        if engine == "selected_plane":
+            # convert the diameters of all frames to surface tensions in one call
+            surface_tensions = calculate_surface_tension(
+                de, ds, scale=scale, density=density, hin_table=hin_table
+            )
+        dynamic_surface_tension = [
+            [time, surface_tension]
+            for time, surface_tension in zip(times, surface_tensions)
+            if not np.isnan(surface_tension)
+        ]
+        if not dynamic_surface_tension:
+            logger.warning(f"Re-analysis: no drop found in the images of {well_id}.")
+            continue
+        save_dynamic_surface_tension(
+            dynamic_surface_tension, well_id, experiment_name=experiment_name
+        )
+        surface_tensions_eq[well_id] = calculate_equillibrium_value_in_window(
+            x=dynamic_surface_tension, time_window=eq_time_window, column_index=1
+        )
+
+    if update_results_surface_tension(experiment_name, surface_tensions_eq) is None:
+        logger.warning("Re-analysis: no results.csv found, only wrote dynamic surface tensions.")
+    logger.info(f"Re-analysis of {experiment_name} finished.")
+    return surface_tensions_eq
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-analyse the archived pendant drop images of an experiment."
+    )
+    parser.add_argument("experiment_name")
+    parser.add_argument("--scale", type=float, default=None, help="scale in mm/px")
+    parser.add_argument("--density", type=float, default=None, help="density in g/mL")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "--method",
+        default=None,
+        choices=["profile", "contour"],
+        help="defaults to ANALYSIS_METHOD of the experiment",
+    )
+    parser.add_argument(
+        "--engine",
+        default=None,
+        choices=["selected_plane", "young_laplace"],
+        help="defaults to ANALYSIS_ENGINE of the experiment",
+    )
+    parser.add_argument(
+        "--eq-window",
+        type=float,
+        default=None,
+        help="s averaged for the equilibrium, defaults to EQUILIBRIUM_WINDOW of "
+        "the experiment",
+    )
+    args = parser.parse_args()
+    reanalyse_experiment(
+        experiment_name=args.experiment_name,
+        scale=args.scale,
+        density=args.density,
+        processes=args.processes,
+        method=args.method,
+        engine=args.engine,
+        eq_time_window=args.eq_window,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Adaptive analysis rate for the dynamic surface tension of a pendant drop.
+
+Right after a drop is formed the surface tension drops quickly as surfactant
+adsorbs, near equilibrium it hardly changes. The rate follows the slope of the
+measured surface tension, so that consecutive analyses differ by about a fixed
+step in surface tension, within a minimum and maximum rate.
+"""
+
+import numpy as np
+
+
+class AdaptiveRate:
+    def __init__(
+        self,
+        min_rate: float = 1.0,
+        max_rate: float = 10.0,
+        resolution: float = 0.05,
+        window: float = 3.0,
+    ):
+        """
+        :param min_rate: lowest analysis rate in Hz, near equilibrium
+        :param max_rate: highest analysis rate in Hz, while the surface tension
+            changes quickly or before there are enough measurements
+        :param resolution: change in surface tension (mN/m) aimed for between two
+            analyses, about the noise of a single measurement
+        :param window: time span (s) of the last measurements the slope is fitted
+            on, at least 3 / min_rate so that it holds 3 measurements at the
+            minimum rate
+        """
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("scheduler: need 0 < min_rate <= max_rate")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.resolution = resolution
+        self.window = max(window, 3 / min_rate)
+        self.rate = None  # rate of the last fit
+
+    def slope(self, st_t: list):
+        """
+        Rate of change of the surface tension (mN/m/s) from a linear fit of the
+        measurements in the last window, None if there are too few of them.
+
+        :param st_t: list of [time (s), surface tension (mN/m)]
+        """
+        if len(st_t) < 3:
+            return None
+        # only the tail of st_t can fall within the window
+        recent = np.array(st_t[-int(np.ceil(self.window * self.max_rate)) - 1 :])
+        recent = recent[recent[:, 0] >= recent[-1, 0] - self.window]
+        if len(recent) < 3 or np.ptp(recent[:, 0]) == 0:
+            return None
+        return np.polyfit(recent[:, 0], recent[:, 1], 1)[0]
+
+    def interval(self, st_t: list):
+        """
+        Time (s) until the next analysis, at the maximum rate until the first fit
+        and at the rate of the last fit when the slope cannot be fitted.
+
+        :param st_t: list of [time (s), surface tension (mN/m)] measured so far
+        """
+        slope = self.slope(st_t)
+        if slope is not None:
+            rate = abs(slope) / self.resolution
+            self.rate = np.clip(rate, self.min_rate, self.max_rate)
+        elif self.rate is None:
+            return 1 / self.max_rate
+        return 1 / self.rate
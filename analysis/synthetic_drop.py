@@ -0,0 +1,110 @@
+"""
+Synthetic backlit pendant drop images with a known surface tension, to test and
+benchmark PendantDropAnalysis without the camera.
+"""
+
+import cv2
+import numpy as np
+
+from analysis.image_analysis import GRAVITY_CONSTANT
+from analysis.young_laplace import integrate_profiles
+
+
+def render_pendant_drop(
+    surface_tension: float = 72.0,
+    density: float = 0.998,
+    scale: float = 0.0027,
+    apex_radius: float = 1.5,
+    needle_diameter: float = None,
+    width: int = 2448,
+    height: int = 2048,
+    centre: float = None,
+    apex_height: float = None,
+    background: int = 220,
+    foreground: int = 30,
+    blur: float = 1.0,
+    noise: float = 2.0,
+    supersampling: int = 4,
+    seed: int = None,
+):
+    """
+    Render a Mono8 image of a pendant drop hanging from a needle at the top of the frame.
+
+    :param surface_tension: surface tension in mN/m
+    :param density: density in g/mL
+    :param scale: scale in mm/px
+    :param apex_radius: radius of curvature at the apex in mm, sets the drop size
+    :param needle_diameter: outer diameter of the needle in mm, defaults to the
+        width of the drop at its neck
+    :param centre: x of the drop axis in px, defaults to just off the frame centre
+    :param apex_height: y of the apex in px, defaults to 90% of the frame height
+    :param background: grey value of the backlight
+    :param foreground: grey value of the drop and needle
+    :param blur: sigma of the optical blur in px
+    :param noise: standard deviation of the sensor noise in grey values
+    :param supersampling: supersampling factor used for anti-aliasing the outline
+    :param seed: seed for the sensor noise
+
+    :return: image and dictionary with the ground truth (surface tension, Bond
+        number, apex radius in px and volume in uL)
+    """
+    if centre is None:
+        centre = width / 2 + 0.3
+    if apex_height is None:
+        apex_height = 0.9 * height
+
+    bond_number = density * GRAVITY_CONSTANT * apex_radius**2 / surface_tension
+    z = np.arange(0, 5, 0.001)
+    x = integrate_profiles([bond_number], z)[0]
+    valid = ~np.isnan(x)
+    z, x = z[valid], x[valid]
+
+    # the drop hangs from the needle where it has narrowed to the needle diameter
+    top = x.size - 1
+    if needle_diameter is not None:
+        equator = np.argmax(x)
+        narrow = np.flatnonzero(x[equator:] <= needle_diameter / 2 / apex_radius)
+        if narrow.size:
+            top = equator + narrow[0]
+    z, x = z[: top + 1], x[: top + 1]
+
+    b = apex_radius / scale  # px
+    if apex_height - z[-1] * b < 0:
+        raise ValueError("synthetic drop: drop does not fit in the frame")
+
+    drop = np.concatenate(
+        (
+            np.column_stack((centre - x * b, apex_height - z * b)),
+            np.column_stack((centre + x * b, apex_height - z * b))[::-1],
+        )
+    )
+    needle_top = apex_height - z[-1] * b
+    needle = np.array(
+        [
+            [centre - x[-1] * b, 0],
+            [centre + x[-1] * b, 0],
+            [centre + x[-1] * b, needle_top + 1],
+            [centre - x[-1] * b, needle_top + 1],
+        ]
+    )
+
+    mask = np.zeros((height * supersampling, width * supersampling), dtype=np.uint8)
+    for polygon in (drop, needle):
+        cv2.fillPoly(mask, [np.round(polygon * supersampling).astype(np.int32)], 255)
+    coverage = cv2.resize(mask, (width, height), interpolation=cv2.INTER_AREA) / 255
+
+    image = background - (background - foreground) * coverage
+    if blur > 0:
+        image = cv2.GaussianBlur(image, (0, 0), blur)
+    if noise > 0:
+        image = image + np.random.default_rng(seed).normal(0, noise, image.shape)
+    image = np.clip(np.round(image), 0, 255).astype(np.uint8)
+
+    slices = np.pi * x**2
+    volume = np.sum((slices[1:] + slices[:-1]) / 2 * np.diff(z)) * apex_radius**3  # uL
+    return image, {
+        "surface_tension": surface_tension,
+        "bond_number": bond_number,
+        "apex_radius": b,
+        "volume": volume,
+    }
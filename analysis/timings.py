@@ -0,0 +1,78 @@
+"""
+Aggregation of the per-stage timings that PendantDropAnalysis records for every
+frame, to find out which stage holds the analysis back.
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimings:
+    def __init__(self, window: int = 200):
+        """
+        :param window: number of most recent frames the rolling percentiles are
+            taken over, all frames are kept for the summary of a droplet
+        """
+        self.window = window
+        self.recent = {}  # stage -> durations of the last frames
+        self.all = {}  # stage -> durations of all frames
+
+    def add(self, timings: dict):
+        """
+        Add the timings of one frame.
+
+        :param timings: dictionary of stage -> duration in s
+        """
+        for stage, duration in timings.items():
+            if stage not in self.all:
+                self.recent[stage] = deque(maxlen=self.window)
+                self.all[stage] = []
+            self.recent[stage].append(duration)
+            self.all[stage].append(duration)
+
+    def reset(self):
+        self.recent = {}
+        self.all = {}
+
+    @staticmethod
+    def _summarise(durations: dict):
+        summary = {}
+        for stage, stage_durations in durations.items():
+            stage_durations = np.array(stage_durations) * 1000  # s -> ms
+            summary[stage] = {
+                "count": int(stage_durations.size),
+                "mean (ms)": float(stage_durations.mean()),
+                **{
+                    f"p{q} (ms)": float(value)
+                    for q, value in zip(
+                        PERCENTILES, np.percentile(stage_durations, PERCENTILES)
+                    )
+                },
+            }
+        return summary
+
+    def percentiles(self):
+        """
+        Rolling percentiles of every stage over the last window frames.
+
+        :return: dictionary of stage -> count, mean and percentiles in ms
+        """
+        return self._summarise({s: list(d) for s, d in self.recent.items()})
+
+    def summary(self):
+        """
+        Percentiles of every stage over all frames since the last reset.
+
+        :return: DataFrame with one row per stage
+        """
+        summary = pd.DataFrame.from_dict(self._summarise(self.all), orient="index")
+        summary.index.name = "stage"
+        return summary
+
+    def save(self, file_path: str):
+        """Save the summary of all frames as csv."""
+        self.summary().to_csv(file_path)
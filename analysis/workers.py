@@ -0,0 +1,206 @@
+"""
+Pendant drop analysis in a pool of worker processes.
+
+Frames are copied into slots of a block of shared memory, so only a slot number
+goes through the task queue. Each worker keeps its own PendantDropAnalysis (and
+with it its own ROI) and sends back the measurement of a frame, which
+AnalysisPool hands out again in the order the frames were submitted.
+"""
+
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from analysis.image_analysis import PendantDropAnalysis
+
+
+def _worker(memory_name, shape, dtype, analyzer_kwargs, tasks, results):
+    cv2.setNumThreads(1)  # parallelism comes from the processes
+    memory = shared_memory.SharedMemory(name=memory_name)
+    frames = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    analyzer = PendantDropAnalysis(frame_shape=shape[1:3], **analyzer_kwargs)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        sequence, slot = task
+        image = frames[slot]
+        measurement = None
+        start = time.perf_counter()
+        rejection = analyzer.prescreen(image)
+        timings = {"prescreen": time.perf_counter() - start}
+        if rejection is None:
+            try:
+                measurement = analyzer.measure(image)
+                timings.update(measurement.timings)
+            except Exception:
+                rejection = "analysis_failed"
+        results.put((sequence, slot, measurement, rejection, timings))
+
+    del frames
+    memory.close()
+
+
+class AnalysisPool:
+    def __init__(
+        self,
+        processes: int,
+        frame_shape: tuple,
+        dtype=np.uint8,
+        slots: int = None,
+        **analyzer_kwargs,
+    ):
+        """
+        :param processes: number of worker processes
+        :param frame_shape: shape of the frames, (height, width) for Mono8
+        :param dtype: data type of the frames
+        :param slots: number of frames in shared memory, defaults to two per worker
+            so a worker never waits for the next frame to be copied in
+        :param analyzer_kwargs: keyword arguments of PendantDropAnalysis, pass
+            scale and density when the workers should not read them from the settings
+        """
+        self.processes = processes
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots if slots is not None else 2 * processes
+        shape = (self.slots, *self.frame_shape)
+        dtype = np.dtype(dtype)
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(shape)) * dtype.itemsize
+        )
+        self.frames = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        self.free_slots = queue.Queue()
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+
+        # spawn on every platform, forking a process with running threads (grab,
+        # Flask) is not safe
+        context = multiprocessing.get_context("spawn")
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.workers = [
+            context.Process(
+                target=_worker,
+                args=(
+                    self.memory.name,
+                    shape,
+                    dtype.str,
+                    analyzer_kwargs,
+                    self.tasks,
+                    self.results,
+                ),
+                daemon=True,
+            )
+            for _ in range(processes)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        self.submitted = 0  # sequence number of the next frame
+        self.returned = 0  # sequence number of the next result to hand out
+        self.contexts = {}  # sequence -> context passed with the frame
+        self.done = {}  # sequence -> (measurement, rejection, timings)
+        self.lock = threading.Lock()
+        self.closed = False
+        # the owner may never close the pool, e.g. the camera of the server
+        atexit.register(self.close)
+
+    def submit(self, image: np.ndarray, context=None, timeout: float = None):
+        """
+        Copy a frame into shared memory and queue it for analysis. Waits while
+        all slots are in use, so a caller that is faster than the workers is
+        held back instead of piling up frames. Results that arrive meanwhile are
+        kept for collect.
+
+        :param image: frame of frame_shape
+        :param context: returned with the result of the frame, e.g. its time stamp
+        :param timeout: maximum time to wait for a free slot in s
+
+        :return: sequence number of the frame, None if no slot came free in time
+        """
+        if image.shape != self.frame_shape:
+            raise ValueError(
+                f"workers: frame of shape {image.shape}, pool is for {self.frame_shape}"
+            )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                slot = self.free_slots.get_nowait()
+                break
+            except queue.Empty:
+                pass
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self._receive(timeout=remaining)
+
+        np.copyto(self.frames[slot], image)
+        with self.lock:
+            sequence = self.submitted
+            self.submitted += 1
+            self.contexts[sequence] = context
+        self.tasks.put((sequence, slot))
+        return sequence
+
+    def _receive(self, timeout: float = None):
+        """Wait for results of the workers and free their slots."""
+        received = []
+        try:
+            received.append(self.results.get(timeout=timeout))
+            while True:
+                received.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        with self.lock:
+            for sequence, slot, measurement, rejection, timings in received:
+                self.done[sequence] = (measurement, rejection, timings)
+                self.free_slots.put(slot)
+
+    def in_flight(self):
+        """Number of submitted frames whose result has not been handed out."""
+        return self.submitted - self.returned
+
+    def collect(self, timeout: float = None):
+        """
+        Wait for results and hand out the ones that are next in frame order.
+
+        :param timeout: maximum time to wait for results in s, when the next
+            result is not in yet
+
+        :return: list of (context, measurement, rejection, timings) in frame
+            order, measurement is None for a rejected frame and rejection is the
+            reason (as PendantDropAnalysis.prescreen, or "analysis_failed")
+        """
+        if self.returned not in self.done:
+            self._receive(timeout=timeout)
+
+        ordered = []
+        with self.lock:
+            while self.returned in self.done:
+                measurement, rejection, timings = self.done.pop(self.returned)
+                context = self.contexts.pop(self.returned)
+                ordered.append((context, measurement, rejection, timings))
+                self.returned += 1
+        return ordered
+
+    def close(self):
+        """Stop the workers and release the shared memory, once."""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        del self.frames
+        self.memory.close()
+        self.memory.unlink()
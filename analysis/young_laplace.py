@@ -0,0 +1,215 @@
+"""
+Young-Laplace fitting of pendant drop profiles.
+
+Instead of integrating the Young-Laplace equation for every frame, the profiles
+of axisymmetric pendant drops are computed once for a grid of Bond numbers and
+kept as a library of dimensionless half widths X(Z), with x and z in units of the
+apex radius of curvature b and z measured upwards from the apex. Fitting a frame
+then only interpolates in this library. Profiles end at their first neck.
+"""
+
+import functools
+
+import numpy as np
+from scipy.optimize import minimize
+
+BOND_NUMBERS = np.linspace(0.02, 0.8, 157)  # beta = delta rho * g * b^2 / gamma
+Z_STEP = 0.005  # resolution of the library in units of b
+Z_MAX = 5.0
+ARC_STEP = 0.002  # integration step along the profile in units of b
+
+
+def _profile_derivatives(x, z, phi, bond_numbers):
+    # dimensionless Young-Laplace equation along the arc length s,
+    # phi is the angle of the tangent with the horizontal
+    return (
+        np.cos(phi),
+        np.sin(phi),
+        2 - bond_numbers * z - np.sin(phi) / x,
+    )
+
+
+def integrate_profiles(bond_numbers, z_grid):
+    """
+    Integrate the dimensionless profiles of an array of Bond numbers at once (RK4)
+    and resample them on a Z grid.
+
+    :return: half widths X (Bond number x Z), NaN above the first neck of a profile
+    """
+    bond_numbers = np.asarray(bond_numbers, dtype=float)
+    n_steps = int(3 * z_grid[-1] / ARC_STEP)
+
+    # start just off the apex, where the profile is a sphere of radius 1
+    s0 = 1e-3
+    x = np.full(bond_numbers.shape, s0)
+    z = np.full(bond_numbers.shape, s0**2 / 2)
+    phi = np.full(bond_numbers.shape, s0)
+    active = np.ones(bond_numbers.shape, dtype=bool)
+
+    xs = np.full((n_steps + 1, bond_numbers.size), np.nan)
+    zs = np.full((n_steps + 1, bond_numbers.size), np.nan)
+    xs[0], zs[0] = x, z
+    h = ARC_STEP
+    for step in range(1, n_steps + 1):
+        k1 = _profile_derivatives(x, z, phi, bond_numbers)
+        k2 = _profile_derivatives(
+            x + h / 2 * k1[0], z + h / 2 * k1[1], phi + h / 2 * k1[2], bond_numbers
+        )
+        k3 = _profile_derivatives(
+            x + h / 2 * k2[0], z + h / 2 * k2[1], phi + h / 2 * k2[2], bond_numbers
+        )
+        k4 = _profile_derivatives(
+            x + h * k3[0], z + h * k3[1], phi + h * k3[2], bond_numbers
+        )
+        x = x + h / 6 * (k1[0] + 2 * k2[0] + 2 * k3[0] + k4[0])
+        z = z + h / 6 * (k1[1] + 2 * k2[1] + 2 * k3[1] + k4[1])
+        phi = phi + h / 6 * (k1[2] + 2 * k2[2] + 2 * k3[2] + k4[2])
+
+        # a profile stops being a single valued X(Z) once it turns back down
+        active &= (phi < np.pi) & (x > 0) & (z <= z_grid[-1])
+        if not active.any():
+            break
+        xs[step] = np.where(active, x, np.nan)
+        zs[step] = np.where(active, z, np.nan)
+
+    half_widths = np.full((bond_numbers.size, z_grid.size), np.nan)
+    for i in range(bond_numbers.size):
+        valid = ~np.isnan(zs[:, i])
+        half_widths[i] = np.interp(
+            z_grid, zs[valid, i], xs[valid, i], right=np.nan
+        )
+        # a pendant drop hangs from a needle at or below its first neck, beyond
+        # it the solution continues into the next bulge of an unduloid
+        increasing = np.diff(half_widths[i]) > 0
+        equator = np.argmin(increasing)
+        neck = equator + np.argmax(increasing[equator:])
+        if neck > equator:
+            half_widths[i, neck + 1 :] = np.nan
+    return half_widths
+
+
+@functools.lru_cache(maxsize=None)
+def load_profile_library():
+    """
+    Profiles of all BOND_NUMBERS on a uniform Z grid. Cached, so the integration
+    runs once per process.
+
+    :return: dictionary with the Z grid, the half widths X (Bond number x Z, NaN
+        above the valid part of a profile) and the cumulative volume pi * int X^2 dZ
+    """
+    z_grid = np.arange(0, Z_MAX + Z_STEP, Z_STEP)
+    half_widths = integrate_profiles(BOND_NUMBERS, z_grid)
+
+    # cumulative volume from the apex up, in units of b^3
+    slices = np.pi * half_widths**2
+    volumes = np.concatenate(
+        (
+            np.zeros((BOND_NUMBERS.size, 1)),
+            np.cumsum((slices[:, 1:] + slices[:, :-1]) / 2 * Z_STEP, axis=1),
+        ),
+        axis=1,
+    )
+    return {"z": z_grid, "x": half_widths, "volume": volumes}
+
+
+def _interpolate(table, bond_index, z):
+    """
+    Bilinear interpolation in a library table at fractional Bond number indices
+    (one per row of z) and dimensionless heights z (rows x points).
+    """
+    bond_index = np.clip(bond_index, 0, BOND_NUMBERS.size - 1)
+    b0 = np.minimum(np.floor(bond_index).astype(int), BOND_NUMBERS.size - 2)
+    b_frac = (bond_index - b0)[:, None]
+
+    z_index = z / Z_STEP
+    z0 = np.floor(z_index).astype(int)
+    outside = (z0 < 0) | (z0 >= table.shape[1] - 1)
+    z0 = np.clip(z0, 0, table.shape[1] - 2)
+    z_frac = z_index - z0
+
+    rows = b0[:, None]
+    values = (
+        table[rows, z0] * (1 - z_frac) * (1 - b_frac)
+        + table[rows, z0 + 1] * z_frac * (1 - b_frac)
+        + table[rows + 1, z0] * (1 - z_frac) * b_frac
+        + table[rows + 1, z0 + 1] * z_frac * b_frac
+    )
+    values[outside] = np.nan
+    return values
+
+
+class YoungLaplaceFitter:
+    """
+    Fits measured drop half widths against the profile library.
+    """
+
+    def __init__(self):
+        self.library = load_profile_library()
+        self.max_half_widths = np.nanmax(self.library["x"], axis=1)
+
+    def _residuals(self, bond_index, apex_radius, heights, radii):
+        model = apex_radius[:, None] * _interpolate(
+            self.library["x"], bond_index, heights[None, :] / apex_radius[:, None]
+        )
+        residuals = np.sqrt(np.mean((model - radii[None, :]) ** 2, axis=1))
+        # a profile that ends below the top of the drop cannot describe it
+        residuals[np.isnan(residuals)] = np.inf
+        return residuals
+
+    def fit(self, heights, radii):
+        """
+        Fit a drop profile.
+
+        :param heights: heights above the apex in px
+        :param radii: half widths of the drop at these heights in px
+
+        :return: dictionary with the Bond number, the apex radius of curvature b
+            in px and the rms residual of the fit in px
+        """
+        heights = np.asarray(heights, dtype=float)
+        radii = np.asarray(radii, dtype=float)
+
+        # coarse search: for every Bond number the apex radius follows from
+        # matching the equatorial radius, evaluated for all of them at once
+        bond_index = np.arange(BOND_NUMBERS.size, dtype=float)
+        apex_radius = radii.max() / self.max_half_widths
+        residuals = self._residuals(bond_index, apex_radius, heights, radii)
+        best = np.argmin(residuals)
+        if not np.isfinite(residuals[best]):
+            raise ValueError("analysis: drop profile does not match any Young-Laplace profile")
+
+        # refine Bond number and apex radius together
+        def cost(params):
+            return self._residuals(
+                np.array([params[0]]), np.array([params[1]]), heights, radii
+            )[0]
+
+        result = minimize(
+            cost,
+            x0=[bond_index[best], apex_radius[best]],
+            method="Nelder-Mead",
+            options={"xatol": 1e-3, "fatol": 1e-4},
+        )
+        fractional_index, b = result.x
+        fractional_index = np.clip(fractional_index, 0, BOND_NUMBERS.size - 1)
+        bond_number = np.interp(
+            fractional_index, np.arange(BOND_NUMBERS.size), BOND_NUMBERS
+        )
+        return {
+            "bond_number": float(bond_number),
+            "bond_index": float(fractional_index),
+            "apex_radius": float(b),
+            "residual": float(result.fun),
+        }
+
+    def volume(self, fit, height):
+        """
+        Volume of the fitted drop from the apex up to a height (px), in px^3.
+        """
+        b = fit["apex_radius"]
+        volume = _interpolate(
+            self.library["volume"],
+            np.array([fit["bond_index"]]),
+            np.array([[height / b]]),
+        )[0, 0]
+        return float(volume * b**3)
@@ -0,0 +1,341 @@
+"""
+Archiving of camera frames on a writer thread, so that encoding and writing
+images never holds up the analysis.
+
+Besides image files per frame, the frames of a droplet can be appended to a
+single frame archive: droplet_<n>.frames holds a short header and the frames
+back to back, each compressed on its own with zlib, and droplet_<n>_index.csv
+the frame number, camera timestamp, wall clock time and the offset and size in
+the archive of every frame, for random access. Without compression the frames
+are stored raw and the archive is memory mapped.
+"""
+
+import csv
+import json
+import os
+import queue
+import threading
+import zlib
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pandas as pd
+
+CODECS = ("archive", "png", "jpeg", "raw")
+ARCHIVE_MAGIC = b"PDFRAME1"
+ARCHIVE_HEADER_SIZE = 256  # bytes, magic followed by a json header
+
+
+def archive_index_path(file_path: str):
+    return f"{os.path.splitext(file_path)[0]}_index.csv"
+
+
+class FrameArchiveWriter:
+    def __init__(
+        self, file_path: str, shape: tuple, dtype=np.uint8, compression: int = 1
+    ):
+        """
+        Create a frame archive for frames of one shape and data type.
+
+        :param compression: zlib compression level 0-9 of every frame, 0 stores
+            the frames raw
+        """
+        self.file_path = file_path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.compression = compression
+        header = json.dumps(
+            {"dtype": self.dtype.str, "shape": self.shape, "compression": compression}
+        ).encode()
+        header = ARCHIVE_MAGIC + header
+        if len(header) > ARCHIVE_HEADER_SIZE:
+            raise ValueError("archive: frame shape does not fit in the header")
+        self.file = open(file_path, "wb")
+        self.file.write(header.ljust(ARCHIVE_HEADER_SIZE, b" "))
+        self.index_file = open(archive_index_path(file_path), "w", newline="")
+        self.index = csv.writer(self.index_file)
+        self.index.writerow(
+            ["frame number", "timestamp (s)", "time", "offset", "size"]
+        )
+        self.offset = ARCHIVE_HEADER_SIZE
+        self.count = 0
+
+    def write(self, frame, time_stamp: datetime):
+        """
+        Append a frame.
+
+        :return: False if the frame does not match the shape of the archive
+        """
+        if frame.image.shape != self.shape or frame.image.dtype != self.dtype:
+            return False
+        data = memoryview(np.ascontiguousarray(frame.image)).cast("B")
+        if self.compression:
+            data = zlib.compress(data, self.compression)
+        self.file.write(data)
+        self.index.writerow(
+            [
+                frame.frame_number,
+                f"{frame.timestamp:.6f}",
+                time_stamp.isoformat(),
+                self.offset,
+                len(data),
+            ]
+        )
+        self.offset += len(data)
+        self.count += 1
+        return True
+
+    def flush(self):
+        self.file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+
+class FrameArchive:
+    """
+    Read access to a frame archive, frames are only read from disk when they are
+    used: compressed frames are decompressed one at a time, raw frames are
+    memory mapped.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, "rb") as file:
+            header = file.read(ARCHIVE_HEADER_SIZE)
+        if not header.startswith(ARCHIVE_MAGIC):
+            raise ValueError(f"archive: {file_path} is not a frame archive")
+        header = json.loads(header[len(ARCHIVE_MAGIC) :].decode())
+        self.dtype = np.dtype(header["dtype"])
+        self.shape = tuple(header["shape"])
+        self.compression = header.get("compression", 0)
+        self.index = pd.read_csv(archive_index_path(file_path))
+        self.file = None
+
+        # an archive that was not closed can end in a partly written frame
+        file_size = os.path.getsize(file_path)
+        if self.compression:
+            complete = self.index["offset"] + self.index["size"] <= file_size
+            self.index = self.index[complete.cummin()]
+            self.frames = None
+            return
+        frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        n_frames = min(
+            (file_size - ARCHIVE_HEADER_SIZE) // frame_size,
+            len(self.index),
+        )
+        self.index = self.index.iloc[:n_frames]
+        self.frames = np.memmap(
+            file_path,
+            dtype=self.dtype,
+            mode="r",
+            offset=ARCHIVE_HEADER_SIZE,
+            shape=(n_frames, *self.shape),
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if self.frames is not None:
+            return self.frames[i]
+        if self.file is None:
+            self.file = open(self.file_path, "rb")
+        self.file.seek(int(self.index["offset"].iat[i]))
+        data = zlib.decompress(self.file.read(int(self.index["size"].iat[i])))
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.shape)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+
+
+class ImageArchiver:
+    def __init__(
+        self,
+        codec: str = "png",
+        png_compression: int = 1,
+        jpeg_quality: int = 95,
+        rate: float = 1.0,
+        max_queue: int = 16,
+        logger=None,
+        archive_compression: int = 1,
+    ):
+        """
+        :param codec: "archive" (all frames of a droplet in one frame archive,
+            zlib compressed), "png" (lossless), "jpeg" (lossy, smallest) or "raw"
+            (numpy .npy files, not encoded at all)
+        :param png_compression: PNG compression level 0-9, higher is smaller and slower
+        :param jpeg_quality: JPEG quality 0-100
+        :param rate: frames archived per second of camera time
+        :param max_queue: frames waiting to be written, frames offered while the
+            queue is full are dropped and counted
+        :param logger: Logger for frames that could not be written
+        :param archive_compression: zlib compression level 0-9 of the frames in a
+            frame archive, 0 stores them raw (about 5 MB per full frame)
+        """
+        if codec not in CODECS:
+            raise ValueError(f"archive: unknown codec {codec}, use one of {CODECS}")
+        self.codec = codec
+        self.extension = {
+            "archive": ".frames",
+            "png": ".png",
+            "jpeg": ".jpg",
+            "raw": ".npy",
+        }[codec]
+        self.parameters = {
+            "archive": [],
+            "png": [cv2.IMWRITE_PNG_COMPRESSION, png_compression],
+            "jpeg": [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality],
+            "raw": [],
+        }[codec]
+        self.archive_compression = archive_compression
+        self.interval = 1 / rate
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.logger = logger
+        self.thread = None
+        self.directory = None
+        self.archive = None  # FrameArchiveWriter of the archive codec
+        self.last_timestamp = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self, directory: str):
+        """
+        Start archiving into a directory, created here once instead of per frame.
+        The archive codec writes <directory>.frames instead.
+        """
+        if self.codec == "archive":
+            os.makedirs(os.path.dirname(directory), exist_ok=True)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.archive = None
+        self.last_timestamp = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def offer(self, frame):
+        """
+        Queue a frame if it is due at the archiving rate, never waits.
+
+        :param frame: Frame of the frame buffer
+        """
+        if self.thread is None:
+            return
+        if (
+            self.last_timestamp is not None
+            and frame.timestamp - self.last_timestamp < self.interval
+        ):
+            return
+        self.last_timestamp = frame.timestamp
+        # the file name holds the wall clock time the frame was offered at
+        try:
+            self.queue.put_nowait((datetime.now(), frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            # write everything that is queued in one go
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in batch:
+                if item is None:
+                    self._close_archive()
+                    return
+                time_stamp, frame = item
+                # a frame that cannot be written must not stop the writer, stop
+                # waits for it
+                try:
+                    self._write_frame(frame, time_stamp)
+                except Exception as e:
+                    self.failed += 1
+                    self._log_error(
+                        f"Archive: could not write frame {frame.frame_number}: {e}"
+                    )
+            if self.archive is not None:
+                try:
+                    self.archive.flush()
+                except Exception as e:
+                    self._log_error(
+                        f"Archive: could not flush {self.archive.file_path}: {e}"
+                    )
+
+    def _write_frame(self, frame, time_stamp: datetime):
+        if self.codec == "archive":
+            self._append(frame, time_stamp)
+            return
+        file_path = f"{self.directory}/{time_stamp:%Y%m%d_%H%M%S_%f}{self.extension}"
+        if self.codec == "raw":
+            np.save(file_path, frame.image)
+        elif not cv2.imwrite(file_path, frame.image, self.parameters):
+            raise OSError(f"cv2.imwrite failed for {file_path}")
+        self.written += 1
+
+    def _append(self, frame, time_stamp: datetime):
+        # the archive takes the shape of the first frame
+        if self.archive is None:
+            self.archive = FrameArchiveWriter(
+                f"{self.directory}{self.extension}",
+                shape=frame.image.shape,
+                dtype=frame.image.dtype,
+                compression=self.archive_compression,
+            )
+        if self.archive.write(frame, time_stamp):
+            self.written += 1
+        else:
+            self.dropped += 1
+
+    def _close_archive(self):
+        if self.archive is None:
+            return
+        try:
+            self.archive.close()
+        except Exception as e:
+            self._log_error(f"Archive: could not close {self.archive.file_path}: {e}")
+
+    def _log_error(self, message: str):
+        if self.logger is not None:
+            self.logger.error(message)
+        else:
+            print(message)
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Write the frames that are still queued and stop the writer thread.
+
+        :param timeout: time in s the writer gets for the queued frames, frames
+            still queued after it are dropped
+        """
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            while True:
+                try:
+                    if self.queue.get_nowait() is not None:
+                        self.dropped += 1
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self._log_error("Archive: writer thread did not stop.")
+        self.thread = None
+
+    def statistics(self):
+        return {"written": self.written, "dropped": self.dropped, "failed": self.failed}
@@ -0,0 +1,100 @@
+"""
+MJPEG video feed shared by all web clients of a camera.
+"""
+
+import threading
+import time
+
+import cv2
+
+
+class MJPEGBroadcaster:
+    """
+    Encodes each new frame of a camera once, at most at the preview rate, and
+    hands the same JPEG bytes to every connected client. The encoder thread only
+    runs while a client is connected, so an unwatched camera costs nothing, and
+    sleeps until the camera calls notify for a new frame.
+    """
+
+    def __init__(self, get_frame, rate: float = 10.0, quality: int = 80):
+        """
+        :param get_frame: callable returning the image to show, or None; read
+            after notify, a frame is encoded again only when a different image
+            object is returned
+        :param rate: maximum number of frames per second sent to the clients
+        :param quality: JPEG quality 0-100
+        """
+        self.get_frame = get_frame
+        self.interval = 1 / rate
+        self.parameters = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.condition = threading.Condition()
+        self.clients = 0
+        self.jpeg = None  # latest encoded frame, multipart chunk
+        self.sequence = 0  # number of the latest encoded frame
+        self.updates = 0  # number of times a new frame was notified
+        self.thread = None
+
+    def notify(self):
+        """Wake the encoder, called by the camera when it has a new frame."""
+        with self.condition:
+            self.updates += 1
+            self.condition.notify_all()
+
+    def _encode(self):
+        last_image = None
+        updates = -1  # encode the frame that is there when the first client joins
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.clients == 0 or self.updates != updates
+                )
+                if self.clients == 0:
+                    self.thread = None
+                    self.jpeg = None
+                    return
+                updates = self.updates
+            start = time.time()
+            image = self.get_frame()
+            if image is not None and image is not last_image:
+                ret, buffer = cv2.imencode(".jpg", image, self.parameters)
+                if ret:
+                    with self.condition:
+                        self.jpeg = (
+                            b"--frame\r\n"
+                            b"Content-Type: image/jpeg\r\n\r\n"
+                            + buffer.tobytes()
+                            + b"\r\n"
+                        )
+                        self.sequence += 1
+                        self.condition.notify_all()
+                last_image = image
+            # the preview rate caps the encoding, frames notified meanwhile are
+            # skipped in favour of the newest one
+            time.sleep(max(self.interval - (time.time() - start), 0))
+
+    def stream(self):
+        """
+        Generator of multipart JPEG chunks for one client, for a Flask Response
+        with mimetype multipart/x-mixed-replace; boundary=frame.
+        """
+        with self.condition:
+            self.clients += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._encode, daemon=True)
+                self.thread.start()
+            sequence = self.sequence
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: self.sequence != sequence, timeout=1.0
+                    )
+                    if self.sequence == sequence:
+                        continue
+                    sequence = self.sequence
+                    jpeg = self.jpeg
+                yield jpeg
+        finally:
+            with self.condition:
+                self.clients -= 1
+                self.condition.notify_all()
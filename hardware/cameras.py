@@ -4,6 +4,7 @@ import threading
 from threading import Thread, Event
 import time
 import os
+from collections import Counter
 from datetime import datetime
 import matplotlib
 
@@ -15,10 +16,16 @@ from io import BytesIO
 from utils.load_save_functions import load_settings
 from utils.logger import Logger
 from analysis.image_analysis import PendantDropAnalysis
+from analysis.scheduler import AdaptiveRate
+from analysis.timings import StageTimings
+from analysis.workers import AnalysisPool
+from hardware.archive import ImageArchiver
+from hardware.broadcaster import MJPEGBroadcaster
+from hardware.frame_buffer import FrameBuffer
 
 
 class OpentronCamera:
-    def __init__(self, width=640, height=480, fps=60):
+    def __init__(self, width=640, height=480, fps=60, preview_rate=10):
         self.camera = cv2.VideoCapture(0)
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
@@ -27,32 +34,42 @@ class OpentronCamera:
         if not self.camera.isOpened():
             raise Exception("Error: Could not open camera.")
 
-        self.current_frame = None
+        self.frames = FrameBuffer(capacity=2)  # Latest frames of the camera
         self.stop_background_threads = Event()
+        self.broadcaster = MJPEGBroadcaster(
+            lambda: self.current_frame, rate=preview_rate
+        )
 
         # Start the frame capture thread
         self.thread = Thread(target=self.capture_frames, daemon=True)
         self.thread.start()
 
+    @property
+    def current_frame(self):
+        """Latest frame captured by the camera."""
+        frame = self.frames.latest()
+        return None if frame is None else frame.image
+
     def capture_frames(self):
+        # read blocks until the camera delivers the next frame
+        frame_number = 0
         while not self.stop_background_threads.is_set():
             success, frame = self.camera.read()
             if success:
-                self.current_frame = frame
+                self.frames.put(
+                    frame, timestamp=time.monotonic(), frame_number=frame_number
+                )
+                frame_number += 1
+                self.broadcaster.notify()
             else:
                 print("Error: Could not read frame.")
+                # a camera that is gone fails at once, do not spin on it
+                self.stop_background_threads.wait(1.0)
+        self.frames.close()
 
     def generate_frames(self):
-        while True:
-            if self.current_frame is not None:
-                # Encode the frame in JPEG format
-                ret, buffer = cv2.imencode(".jpg", self.current_frame)
-                frame = buffer.tobytes()
-
-                # Yield the frame in byte format
-                yield (
-                    b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-                )
+        # frames are encoded once for all clients
+        yield from self.broadcaster.stream()
 
     def stop(self):
         self.stop_background_threads.set()
@@ -63,14 +80,21 @@ class PendantDropCamera:
 
     def __init__(self):
 
+        settings = load_settings()
         try:
             # Camera settings
             self.camera = pylon.InstantCamera(
                 pylon.TlFactory.GetInstance().CreateFirstDevice()
             )
             self.converter = pylon.ImageFormatConverter()
-            self.converter.OutputPixelFormat = pylon.PixelType_BGR8packed
+            # the backlit drop is grayscale, Mono8 keeps frames a third of the size
+            if settings["PENDANT_DROP_PIXEL_FORMAT"] == "Mono8":
+                self.converter.OutputPixelFormat = pylon.PixelType_Mono8
+            else:
+                self.converter.OutputPixelFormat = pylon.PixelType_BGR8packed
             self.converter.OutputBitAlignment = pylon.OutputBitAlignment_MsbAligned
+            self.configure_binning(int(settings["CAMERA_BINNING"]))
+            self.timestamp_frequency = self._timestamp_frequency()
             self.stop_background_threads = Event()
             self.running = False
             self.streaming = False
@@ -85,110 +109,359 @@ class PendantDropCamera:
         # Initialize attributes
         self.st_t = None  # Will hold time series data for surface tension
         self.scale_t = None # Will hold time series data for scale readings !for calibration
-        self.current_image = None  # Latest image grabbed from the camera
+        self.frames = FrameBuffer(capacity=32)  # Latest frames grabbed from the camera
+        self.start_timestamp = None  # Camera time of the start of the measurement
         self.analysis_image = None  # Latest processed (analyzed) image
         self.thread = None  # For streaming
         self.process_thread = None  # Combined thread for save, analyze, and plot
         self.well_id = None
+        self.broadcaster = MJPEGBroadcaster(  # Video feed shared by all clients
+            self._feed_image,
+            rate=float(settings["PREVIEW_RATE"]),
+            quality=int(settings["PREVIEW_JPEG_QUALITY"]),
+        )
+        self.last_annotation_time = 0
+        self.stage_timings = StageTimings()  # analysis duration per stage
+        self.rejections = Counter()  # reason -> number of frames not measured
+        self.analysis_pool = None  # Worker processes, if ANALYSIS_PROCESSES > 0
+        self.analysis_pool_config = None
+        self.archiver = None  # Writes frames to disk on its own thread
+        self.archive_thread = None  # Offers frames to the archiver
+
+    def configure_binning(self, binning: int):
+        """
+        Bin pixels on the sensor to grab smaller frames at a higher frame rate; the
+        sub-pixel edge detection keeps the precision. SCALE is in mm per grabbed
+        pixel, so calibrate again after changing the binning.
+        """
+        self.camera.Open()
+        if binning == 1:
+            return  # keep the binning of the camera, not all models have the nodes
+        for name in ("BinningHorizontal", "BinningVertical"):
+            if not getattr(self.camera, name).IsWritable():
+                print(
+                    f"Camera: binning {binning} not set, {name} is not writable "
+                    "on this camera. Set CAMERA_BINNING to 1."
+                )
+                return
+        self.camera.BinningHorizontal.SetValue(binning)
+        self.camera.BinningVertical.SetValue(binning)
+
+    def _timestamp_frequency(self):
+        """
+        Ticks per second of the camera clock that time stamps the frames, GigE
+        cameras report it, USB3 cameras count in ns.
+        """
+        try:
+            return float(self.camera.GevTimestampTickFrequency.GetValue())
+        except Exception:
+            return 1e9
+
+    @property
+    def current_image(self):
+        """Latest image grabbed from the camera."""
+        frame = self.frames.latest()
+        return None if frame is None else frame.image
 
     def initialize_measurement(self, well_id: str, drop_count: int):
         self.settings = load_settings()
         self.experiment_name = self.settings["EXPERIMENT_NAME"]
         self.save_dir = f"experiments/{self.experiment_name}/data"
-        self.analyzer = PendantDropAnalysis()
+        frame_shape = (self.camera.Height.GetValue(), self.camera.Width.GetValue())
+        self.analyzer = PendantDropAnalysis(
+            method=self.settings["ANALYSIS_METHOD"],
+            engine=self.settings["ANALYSIS_ENGINE"],
+            frame_shape=frame_shape,
+        )
+        processes = int(self.settings["ANALYSIS_PROCESSES"])
+        if processes > 0:
+            if self.settings["PENDANT_DROP_PIXEL_FORMAT"] != "Mono8":
+                frame_shape = (*frame_shape, 3)
+            self.start_analysis_pool(processes, frame_shape)
+        else:
+            self.close_analysis_pool()
+        self.annotation_interval = 1 / float(self.settings["ANNOTATION_RATE"])
+        self.analysis_rate = AdaptiveRate(
+            min_rate=float(self.settings["ANALYSIS_RATE_MIN"]),
+            max_rate=float(self.settings["ANALYSIS_RATE_MAX"]),
+            resolution=float(self.settings["ANALYSIS_RATE_RESOLUTION"]),
+            window=float(self.settings["ANALYSIS_RATE_WINDOW"]),
+        )
         self.logger = Logger(
             name="protocol",
             file_path=f"experiments/{self.experiment_name}/meta_data",
         )
+        self.archiver = ImageArchiver(
+            codec=self.settings["ARCHIVE_CODEC"],
+            png_compression=int(self.settings["ARCHIVE_PNG_COMPRESSION"]),
+            archive_compression=int(self.settings["ARCHIVE_COMPRESSION"]),
+            jpeg_quality=int(self.settings["ARCHIVE_JPEG_QUALITY"]),
+            rate=float(self.settings["ARCHIVE_RATE"]),
+            logger=self.logger,
+        )
         self.well_id = well_id
         self.drop_count = drop_count
         self.st_t = []  # List to store [time, surface tension] measurements
         self.scale_t = [] # List to store [time, scale reading] measurements
+        self.stage_timings.reset()
+        self.rejections = Counter()
         self.start_stream()
         
+    def start_analysis_pool(self, processes: int, frame_shape: tuple):
+        """
+        Start worker processes that analyse every frame, the pool is kept for the
+        next droplets as long as the analysis settings stay the same.
+        """
+        config = (
+            processes,
+            frame_shape,
+            self.settings["ANALYSIS_ENGINE"],
+            float(self.settings["SCALE"]),
+            float(self.settings["DENSITY"]),
+            self.settings["ANALYSIS_METHOD"],
+        )
+        if self.analysis_pool is not None and self.analysis_pool_config == config:
+            return
+        self.close_analysis_pool()
+        self.analysis_pool = AnalysisPool(
+            processes=processes,
+            frame_shape=frame_shape,
+            engine=config[2],
+            scale=config[3],
+            density=config[4],
+            method=config[5],
+        )
+        self.analysis_pool_config = config
+
+    def close_analysis_pool(self):
+        if self.analysis_pool is not None:
+            self.analysis_pool.close()
+        self.analysis_pool = None
+        self.analysis_pool_config = None
+
     def start_stream(self):
         if not self.streaming:
             self.streaming = True
+            self.frames.reset()
             self.thread = threading.Thread(target=self._stream, daemon=True)
             self.thread.start()
 
     def start_capture(self):
         if not self.running:
             self.start_time = datetime.now()
+            # times of the measurement are on the camera clock, from the last
+            # frame grabbed before the start
+            latest = self.frames.latest()
+            self.start_timestamp = None if latest is None else latest.timestamp
+            self.frames.register("analysis")
+            self.frames.register("archive")
+            self.stop_background_threads.clear()
+            self.archiver.start(
+                f"{self.save_dir}/{self.well_id}/images/droplet_{self.drop_count}"
+            )
             self.running = True
             # Create and start one thread for saving, analyzing, and plotting
             self.process_thread = threading.Thread(
                 target=self._process_thread, daemon=True
             )
             self.process_thread.start()
+            # archived frames do not depend on which frames are analysed
+            self.archive_thread = threading.Thread(
+                target=self._archive_thread, daemon=True
+            )
+            self.archive_thread.start()
             self.logger.info(f"Camera: start measuring {self.well_id}.")
 
     def _stream(self):
-        self.camera.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+        # grab every frame, the frame buffer decides what its consumers skip
+        self.camera.StartGrabbing(pylon.GrabStrategy_OneByOne)
         while self.streaming and self.camera.IsGrabbing():
             grabResult = self.camera.RetrieveResult(
                 5000, pylon.TimeoutHandling_ThrowException
             )
             if grabResult.GrabSucceeded():
                 image = self.converter.Convert(grabResult)
-                self.current_image = image.GetArray()
-                grabResult.Release()
+                self.frames.put(
+                    image.GetArray(),
+                    timestamp=grabResult.GetTimeStamp() / self.timestamp_frequency,
+                    frame_number=grabResult.GetBlockID(),
+                )
+                self.broadcaster.notify()
+            grabResult.Release()
         self.camera.StopGrabbing()
+        self.frames.close()
 
     def _process_thread(self):
         """
-        Combined thread function that:
-          - Saves the current image (if available) every second,
-          - Analyzes the image (if available) every loop iteration,
+        Analyzes the image (if available) at an adaptive rate, densely while the
+        surface tension changes quickly and sparsely near equilibrium. Frames are
+        archived by the archive thread.
         """
-        # Use a timer to ensure saving happens roughly once per second
-        last_save_time = time.time()
-        window_size = 20  # Window size for smoothing in the plot
+        if self.analysis_pool is not None:
+            self._process_frames_in_pool()
+            return
+
+        next_analysis_time = time.time()
+
+        while self.running:
+            # wait until the next analysis is due, stop_capture wakes it earlier
+            delay = next_analysis_time - time.time()
+            if delay > 0 and self.stop_background_threads.wait(delay):
+                break
+
+            # newest frame from the frame buffer, each frame is analysed once
+            frame = self.frames.get("analysis", latest=True, timeout=1.0)
+            if frame is None:
+                continue
+
+            # Analyze the frame
+            analysis_time = time.time()
+            with self.lock:
+                self.analyze_image(frame)
+            next_analysis_time = analysis_time + self.analysis_rate.interval(self.st_t)
 
+    def _archive_thread(self):
+        """
+        Offer the newest frames to the archiver, which keeps them at the archiving
+        rate, independent of the frames the analysis picks.
+        """
         while self.running:
-            if self.current_image is not None:
-                # Save image every ~1 second
-                if time.time() - last_save_time >= 1.0:
-                    self.save_image(self.current_image)
-                    last_save_time = time.time()
-
-                # Analyze the current image
-                with self.lock:
-                    self.analyze_image(self.current_image)
-
-            time.sleep(0.1)
-
-    def save_image(self, img):
-        directory = f"{self.save_dir}/{self.well_id}/images/droplet_{self.drop_count}"
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{directory}/{timestamp}.png"
-        cv2.imwrite(filename, img)
-
-    def analyze_image(self, img):
+            frame = self.frames.get("archive", latest=True, timeout=1.0)
+            if frame is not None:
+                self.archiver.offer(frame)
+
+    def _process_frames_in_pool(self):
+        """
+        Analyse every frame in the worker processes of the analysis pool, the
+        measurements come back in frame order.
+        """
+        while self.running:
+            frame = self.frames.get("analysis", timeout=1.0)
+            if frame is not None:
+                # waits while all workers are busy, frames that arrive meanwhile
+                # are counted as dropped by the frame buffer
+                submitted = self.analysis_pool.submit(
+                    frame.image, context=frame, timeout=1.0
+                )
+                if submitted is None:
+                    with self.lock:
+                        self.rejections["workers_busy"] += 1
+            self._record_pool_results(timeout=0)
+
+        # the frames still being analysed belong to this droplet
+        while self.analysis_pool.in_flight():
+            if not self._record_pool_results(timeout=1.0):
+                break
+
+    def _record_pool_results(self, timeout: float):
+        results = self.analysis_pool.collect(timeout=timeout)
+        with self.lock:
+            for frame, measurement, rejection, timings in results:
+                self.stage_timings.add(timings)
+                if rejection is not None:
+                    self.reject_image(rejection)
+                else:
+                    self.record_measurement(frame, measurement)
+        return results
+
+    def analyze_image(self, frame):
+        # skip frames without a measurable drop before the full analysis
+        start = time.perf_counter()
+        rejection = self.analyzer.prescreen(frame.image)
+        self.stage_timings.add({"prescreen": time.perf_counter() - start})
+        if rejection is not None:
+            self.reject_image(rejection)
+            return
+
         try:
-            time_stamp = datetime.now()
-            relative_time = (time_stamp - self.start_time).total_seconds()
-            st, analysis_image = self.analyzer.image2st(img)
-            scale = self.analyzer.image2scale(img)
-            self.scale_t.append([relative_time, scale])
-            self.st_t.append([relative_time, st])
-            self.analysis_image = analysis_image
-        except Exception as e:
-            # self.logger.error(f"Camera: error {e}")
+            measurement = self.analyzer.measure(frame.image)
+        except Exception:
+            self.reject_image("analysis_failed")
+            return
+        self.stage_timings.add(measurement.timings)
+        self.record_measurement(frame, measurement)
+
+    def reject_image(self, reason: str):
+        self.rejections[reason] += 1
+        self.analysis_image = None
+
+    def record_measurement(self, frame, measurement):
+        if self.start_timestamp is None:
+            self.start_timestamp = frame.timestamp
+        relative_time = frame.timestamp - self.start_timestamp
+        self.scale_t.append([relative_time, measurement.scale])
+        self.st_t.append([relative_time, measurement.surface_tension])
+        self.render_annotation(frame.image, measurement)
+
+    def render_annotation(self, img, measurement):
+        """
+        Render the annotated image for the video feed, only while a client is
+        connected and at most ANNOTATION_RATE times per second.
+        """
+        if self.broadcaster.clients == 0:
             self.analysis_image = None
+        elif time.time() - self.last_annotation_time >= self.annotation_interval:
+            start = time.perf_counter()
+            self.analysis_image = self.analyzer.annotate(measurement, img)
+            self.stage_timings.add({"annotate": time.perf_counter() - start})
+            self.last_annotation_time = time.time()
+            self.broadcaster.notify()
+
+    def analysis_timings(self):
+        """
+        Rolling percentiles of the analysis duration per stage, in ms.
+        """
+        with self.lock:
+            return self.stage_timings.percentiles()
+
+    def frame_statistics(self):
+        """
+        Frames grabbed, missed by the camera and dropped or skipped by consumers.
+        """
+        return self.frames.statistics()
+
+    def rejection_counts(self):
+        """
+        Number of frames of this droplet that were not measured, per reason.
+        """
+        with self.lock:
+            return dict(self.rejections)
+
+    def save_analysis_timings(self):
+        """
+        Save the analysis duration per stage of this droplet next to
+        dynamic_surface_tension.csv.
+        """
+        if not self.stage_timings.all:
+            return
+        directory = f"{self.save_dir}/{self.well_id}"
+        os.makedirs(directory, exist_ok=True)
+        self.stage_timings.save(
+            f"{directory}/analysis_timings_droplet_{self.drop_count}.csv"
+        )
 
     def stop_capture(self):
         self.running = False
         if self.process_thread is not None:
             self.stop_background_threads.set()
             self.process_thread.join()
+        if self.archive_thread is not None:
+            self.archive_thread.join()
+
+        self.archiver.stop()
+        self.save_analysis_timings()
+        if self.rejections:
+            self.logger.info(
+                f"Camera: measured {len(self.st_t)} frames of {self.well_id}, "
+                f"skipped {dict(self.rejections)}."
+            )
+        self.logger.info(f"Camera: frames {self.frame_statistics()}.")
+        self.logger.info(f"Camera: archived frames {self.archiver.statistics()}.")
 
         # Reset the thread attribute so that capture can be restarted
         self.process_thread = None
+        self.archive_thread = None
         self.analysis_image = None
-        self.current_image = None
         self.stop_stream()
         self.logger.info(f"Camera: stopped measurement")
 
@@ -198,31 +471,27 @@ class PendantDropCamera:
             self.stop_background_threads.set()
             self.thread.join()
         self.thread = None
-        self.current_image = None
+        self.frames.reset()
+
+    def close(self):
+        """Stop streaming and the analysis workers when the camera is torn down."""
+        if self.running:
+            self.stop_capture()
+        self.stop_stream()
+        self.close_analysis_pool()
 
     def generate_frames(self):
         """
         Generator for streaming either the analyzed image (if available)
-        or the raw current image.
+        or the raw current image, encoded once for all clients.
         """
-        while True:
-            with self.lock:
-                # Prioritize the analyzed image if available
-                if self.analysis_image is not None:
-                    image4feed = self.analysis_image
-                else:
-                    image4feed = self.current_image
-
-            if image4feed is not None:
-                ret, buffer = cv2.imencode(".jpg", image4feed)
-                if ret:
-                    frame = buffer.tobytes()
-                    yield (
-                        b"--frame\r\n"
-                        b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-                    )
-            else:
-                time.sleep(0.05)
+        yield from self.broadcaster.stream()
+
+    def _feed_image(self):
+        # Prioritize the analyzed image if available
+        if self.analysis_image is not None:
+            return self.analysis_image
+        return self.current_image
 
     def stop_measurement(self):
         if self.process_thread is not None:
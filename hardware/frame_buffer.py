@@ -0,0 +1,143 @@
+"""
+Bounded ring buffer of camera frames, shared by the consumers of a camera
+(analysis, archiving and the video feed).
+"""
+
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Frame:
+    """
+    Frame grabbed from a camera. timestamp is the time of exposure on the camera
+    clock in s, frame_number the number the camera gave the frame and sequence
+    the position of the frame in the buffer.
+    """
+
+    image: np.ndarray
+    timestamp: float
+    frame_number: int
+    sequence: int
+
+
+class FrameBuffer:
+    """
+    The camera never waits for its consumers: once the buffer is full the oldest
+    frame is overwritten. Every consumer reads with its own cursor, either every
+    frame in order or only the latest frame, and counts the frames it lost:
+
+    - dropped: frames overwritten before an in-order consumer read them, the
+      consumer is too slow for the frame rate (backpressure)
+    - skipped: older frames a latest-frame consumer passed over on purpose
+    - missed (of the buffer): frames the camera numbered but never delivered
+    """
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.frames = [None] * capacity
+        self.sequence = -1  # sequence number of the newest frame
+        self.missed = 0
+        self.condition = threading.Condition()
+        self.consumers = {}  # name -> {"cursor", "dropped", "skipped"}
+        self.closed = False
+
+    def put(self, image: np.ndarray, timestamp: float, frame_number: int):
+        """Add a frame, overwriting the oldest one when the buffer is full."""
+        with self.condition:
+            newest = self.latest()
+            if newest is not None and frame_number > newest.frame_number + 1:
+                self.missed += frame_number - newest.frame_number - 1
+            self.sequence += 1
+            self.frames[self.sequence % self.capacity] = Frame(
+                image=image,
+                timestamp=timestamp,
+                frame_number=frame_number,
+                sequence=self.sequence,
+            )
+            self.condition.notify_all()
+
+    def latest(self):
+        """Newest frame, None if there is none."""
+        if self.sequence < 0:
+            return None
+        return self.frames[self.sequence % self.capacity]
+
+    def register(self, name: str):
+        """
+        Register a consumer, it reads from the next frame on.
+        """
+        with self.condition:
+            self.consumers[name] = {
+                "cursor": self.sequence + 1,
+                "dropped": 0,
+                "skipped": 0,
+            }
+
+    def get(self, name: str, latest: bool = False, timeout: float = None):
+        """
+        Wait for the next unread frame of a consumer.
+
+        :param name: name the consumer registered with
+        :param latest: return the newest frame and skip the unread older ones,
+            otherwise return the oldest unread frame still in the buffer
+        :param timeout: maximum time to wait in s, None waits until a frame arrives
+
+        :return: Frame, None on a timeout or when the buffer is closed
+        """
+        with self.condition:
+            consumer = self.consumers[name]
+            if not self.condition.wait_for(
+                lambda: self.closed or self.sequence >= consumer["cursor"],
+                timeout=timeout,
+            ):
+                return None
+            if self.sequence < consumer["cursor"]:
+                return None  # closed
+
+            if latest:
+                consumer["skipped"] += self.sequence - consumer["cursor"]
+                sequence = self.sequence
+            else:
+                oldest = max(self.sequence - self.capacity + 1, 0)
+                consumer["dropped"] += max(oldest - consumer["cursor"], 0)
+                sequence = max(consumer["cursor"], oldest)
+            consumer["cursor"] = sequence + 1
+            return self.frames[sequence % self.capacity]
+
+    def statistics(self):
+        """
+        Frame counters of the buffer and of every consumer, lag is the number of
+        frames a consumer has not read yet.
+        """
+        with self.condition:
+            return {
+                "frames": self.sequence + 1,
+                "missed": self.missed,
+                "consumers": {
+                    name: {
+                        "lag": self.sequence + 1 - consumer["cursor"],
+                        "dropped": consumer["dropped"],
+                        "skipped": consumer["skipped"],
+                    }
+                    for name, consumer in self.consumers.items()
+                },
+            }
+
+    def close(self):
+        """Wake up all waiting consumers, for instance when grabbing stops."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def reset(self):
+        """Empty the buffer, registered consumers read from the first new frame."""
+        with self.condition:
+            self.frames = [None] * self.capacity
+            self.sequence = -1
+            self.missed = 0
+            for consumer in self.consumers.values():
+                consumer["cursor"] = 0
+            self.closed = False
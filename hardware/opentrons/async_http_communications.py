@@ -0,0 +1,313 @@
+"""
+asyncio counterpart of OpentronsAPI, with the same commands as awaitable calls so
+the robot, camera, sensor and plotting can be coordinated by one event loop.
+
+The robot executes commands one at a time, so commands are posted one after
+the other in the order they are awaited; the concurrency is between the robot
+and the other coroutines, e.g.
+
+    async with AsyncOpentronsAPI() as api:
+        await api.initialise()
+        move = asyncio.create_task(api.move_to_well(...))
+        await asyncio.to_thread(plotter.plot_results_well_id, df=results)
+        await move
+"""
+
+import asyncio
+import json
+import os
+
+import aiohttp
+
+from hardware.opentrons import commands
+from utils.load_save_functions import load_settings
+from utils.logger import Logger
+
+
+class AsyncOpentronsAPI:
+    def __init__(self):
+        settings = load_settings()
+        self.ROBOT_IP_ADDRESS = settings["ROBOT_IP"]
+        self.CONNECT_TIMEOUT = float(settings["HTTP_CONNECT_TIMEOUT"])
+        self.READ_TIMEOUT = float(settings["HTTP_READ_TIMEOUT"])
+        self.RETRIES = int(settings["HTTP_RETRIES"])
+        self.BACKOFF_FACTOR = float(settings["HTTP_BACKOFF_FACTOR"])
+        self.LABWARE_DEFINITIONS_FOLDER = os.path.join("labware", "definitions")
+        self.HEADERS = commands.HEADERS
+        self.PROTOCOL_ID = None
+        self.RUN_ID = None
+        self.COMMANDS_URL = None
+        self.session = None  # created in start, inside the event loop
+        self.command_lock = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """Open the connection pool to the robot."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                base_url=commands.base_url(self.ROBOT_IP_ADDRESS),
+                headers=self.HEADERS,
+                connector=aiohttp.TCPConnector(limit=4),
+            )
+            self.command_lock = asyncio.Lock()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        self.session = None
+
+    ####### protocol management #######
+    async def upload_protocol(self, protocol: str):
+        """
+        Method to upload protocol
+        """
+        with open(protocol, "rb") as file:
+            files = aiohttp.FormData()
+            files.add_field("files", file.read(), filename=protocol)
+        status, response = await self._request("POST", "/protocols", data=files)
+        if status == 201:
+            self.PROTOCOL_ID = response["data"]["id"]
+            self.logger.info(f"Protocol uploaded succesfully (ID: {self.PROTOCOL_ID}).")
+        elif status == 200:
+            self.logger.info("Protocol already uploaded, using existing protocol.")
+            self.PROTOCOL_ID = response["data"]["id"]
+        else:
+            self.logger.error(f"Failed to upload protocol \n {response}")
+
+    async def create_run(self):
+        """
+        Method to create a run. Uses the protocol_ID attribute to find the protocol
+        """
+        status, response = await self._request(
+            "POST", "/runs", data=json.dumps({"data": {"protocolId": self.PROTOCOL_ID}})
+        )
+        try:
+            self.RUN_ID = response["data"]["id"]
+            self.COMMANDS_URL = f"/runs/{self.RUN_ID}/commands"
+            self.logger.info(f"Run created succesfully (ID: {self.RUN_ID}).")
+        except (KeyError, TypeError):
+            self.logger.error(f"Failed to create run! \n {response}")
+
+    ####### load functions #######
+    async def load_pipette(self, name: str, mount: str):
+        """
+        Loads pipette for a current run, returns the pipette id.
+        """
+        response = await self._post_command(commands.load_pipette(name, mount))
+        try:
+            return response["data"]["result"]["pipetteId"]
+        except (KeyError, TypeError):
+            self.logger.error(f"failed to load pipette {name}: \n{response}")
+            raise
+
+    async def load_labware(
+        self, labware_name: str, labware_file: str, location: int, custom_labware=False
+    ):
+        """
+        Loads labware for a current run, returns the labware info.
+        """
+        response = await self._post_command(
+            commands.load_labware(labware_file, location, custom_labware)
+        )
+        try:
+            return commands.labware_info(
+                labware_name=labware_name,
+                labware_file=labware_file,
+                location=location,
+                response_result=response["data"]["result"],
+            )
+        except (KeyError, TypeError):
+            self.logger.error(
+                f"failed to load labware {labware_file} on slot {location}. \n {response}"
+            )
+            raise
+
+    async def add_labware_definition(self, labware_definition: str):
+        labware_path = self.LABWARE_DEFINITIONS_FOLDER
+        with open(os.path.join(labware_path, labware_definition), "rb") as file:
+            command_payload = json.dumps({"data": json.load(file)})
+        await self._request(
+            "POST", f"/runs/{self.RUN_ID}/labware_definitions", data=command_payload
+        )
+
+    async def add_all_labware_definitions(self):
+        try:
+            for labware_definition in os.listdir(self.LABWARE_DEFINITIONS_FOLDER):
+                await self.add_labware_definition(labware_definition)
+            self.logger.info("All custom labware definitions added.")
+        except (OSError, aiohttp.ClientError) as e:
+            self.logger.error(f"Failed to add labware definitions: {e}")
+
+    ####### executable functions #######
+    async def home(self):
+        await self._request("POST", "/robot/home", data=json.dumps(commands.home()))
+        self.logger.info("Robot homed.")
+
+    async def delay(
+        self, seconds: float, minutes=0, message=None, intent="setup", log=False
+    ):
+        response = await self._post_command(
+            commands.delay(seconds, minutes, message, intent),
+            duration=commands.delay_duration(seconds, minutes),
+        )
+        if log:
+            self.logger.info(f"Delay of {seconds} seconds & {minutes} minutes.")
+        return response
+
+    async def pick_up_tip(
+        self,
+        pipette_id: str,
+        labware_id: str,
+        well: str,
+        offset: dict = dict(x=0, y=0, z=0),
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.pick_up_tip(pipette_id, labware_id, well, offset, intent)
+        )
+
+    async def drop_tip(
+        self,
+        pipette_id: str,
+        labware_id="fixedTrash",
+        well="A1",
+        offset: dict = dict(x=0, y=0, z=0),
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.drop_tip(pipette_id, labware_id, well, offset, intent)
+        )
+
+    async def aspirate(
+        self,
+        pipette_id: str,
+        labware_id: str,
+        volume: int,
+        well: str,
+        depth=-5,
+        flow_rate=100,
+        offset: dict = dict(x=0, y=0, z=0),
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.aspirate(
+                pipette_id, labware_id, volume, well, depth, flow_rate, offset, intent
+            ),
+            duration=commands.liquid_duration(volume, flow_rate),
+        )
+
+    async def dispense(
+        self,
+        pipette_id: str,
+        labware_id: str,
+        volume: int,
+        well: str,
+        flow_rate: float,
+        depth=-5,
+        offset: dict = dict(x=0, y=0, z=0),
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.dispense(
+                pipette_id, labware_id, volume, well, flow_rate, depth, offset, intent
+            ),
+            duration=commands.liquid_duration(volume, flow_rate),
+        )
+
+    async def blow_out(
+        self,
+        pipette_id: str,
+        labware_id: str,
+        well: str,
+        depth: float = 0,
+        offset: dict = dict(x=0, y=0, z=0),
+        flow_rate=200,
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.blow_out(
+                pipette_id, labware_id, well, depth, offset, flow_rate, intent
+            )
+        )
+
+    async def move_to_well(
+        self,
+        pipette_id: str,
+        labware_id: str,
+        well: str,
+        offset: dict = dict(x=0, y=0, z=0),
+        speed=None,
+        intent="setup",
+    ):
+        return await self._post_command(
+            commands.move_to_well(pipette_id, labware_id, well, offset, speed, intent)
+        )
+
+    ####### utils #######
+    async def _request(self, method: str, path: str, duration: float = 0, **kwargs):
+        """
+        Send a request to the robot, requests that failed to connect never reached
+        the robot and are retried with backoff.
+
+        :param duration: time the robot takes to handle the request in s
+        :return: status code and json body of the response
+        """
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.CONNECT_TIMEOUT, sock_read=self.READ_TIMEOUT + duration
+        )
+        for attempt in range(self.RETRIES + 1):
+            try:
+                async with self.session.request(
+                    method, path, timeout=timeout, **kwargs
+                ) as response:
+                    return response.status, await response.json(content_type=None)
+            except aiohttp.ClientConnectorError:
+                if attempt == self.RETRIES:
+                    raise
+                await asyncio.sleep(self.BACKOFF_FACTOR * 2**attempt)
+
+    async def _post_command(self, command_dict: dict, duration: float = 0):
+        """
+        Post a command to the current run and wait until it is complete.
+
+        :param command_dict: command in the format of the HTTP API
+        :param duration: time the robot takes to execute the command in s
+        :return: json body of the response
+        """
+        async with self.command_lock:
+            try:
+                status, response = await self._request(
+                    "POST",
+                    self.COMMANDS_URL,
+                    duration=duration,
+                    data=json.dumps(command_dict),
+                    params={"waitUntilComplete": "true"},
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(
+                    f"Command {command_dict['data']['commandType']} failed: {e}"
+                )
+                raise
+        return response
+
+    def _initialize_logger(self):
+        settings = load_settings()
+        self.logger = Logger(
+            name="protocol",
+            file_path=f'experiments/{settings["EXPERIMENT_NAME"]}/meta_data',
+        )
+
+    async def initialise(self):
+        self._initialize_logger()
+        await self.start()
+        await self.upload_protocol(
+            protocol=os.path.join("hardware", "opentrons", "protocol_placeholder.py")
+        )
+        await self.create_run()
+        await self.add_all_labware_definitions()
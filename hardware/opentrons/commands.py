@@ -0,0 +1,232 @@
+"""
+Commands of the Opentrons HTTP API, shared by OpentronsAPI and AsyncOpentronsAPI
+so both send exactly the same requests.
+
+Every builder returns the command as posted to /runs/{run id}/commands, the
+duration functions the time the robot takes to execute a command, which is added
+to the read timeout of a request that waits until the command is complete.
+"""
+
+PORT = 31950
+HEADERS = {"opentrons-version": "3"}
+
+
+def base_url(robot_ip: str):
+    return f"http://{robot_ip}:{PORT}"
+
+
+def _command(command_type: str, params: dict, intent: str = "setup"):
+    return {
+        "data": {
+            "commandType": command_type,
+            "params": params,
+            "intent": intent,
+        }
+    }
+
+
+def load_pipette(name: str, mount: str):
+    return _command("loadPipette", {"pipetteName": name, "mount": mount})
+
+
+def load_labware(labware_file: str, location: int, custom_labware=False):
+    if custom_labware == True:
+        namespace = "custom_beta"
+    else:
+        namespace = "opentrons"
+    return _command(
+        "loadLabware",
+        {
+            "location": {"slotName": str(location)},
+            "loadName": labware_file,
+            "namespace": namespace,
+            "version": 1,
+        },
+    )
+
+
+def labware_info(
+    labware_name: str, labware_file: str, location: int, response_result: dict
+):
+    """
+    Labware as used by the containers, from the result of a loadLabware command.
+    """
+    ordering = response_result["definition"]["ordering"]
+    flatten_ordering = [
+        well for row in ordering for well in row
+    ]  # flatten ordering, column wise
+
+    return {
+        "labware_name": labware_name,
+        "labware_file": labware_file,
+        "location": location,
+        "labware_id": response_result["labwareId"],
+        "ordering": flatten_ordering,
+        "well_diameter": response_result["definition"]["wells"]["A1"]["diameter"],
+        "max_volume": response_result["definition"]["wells"]["A1"][
+            "totalLiquidVolume"
+        ],
+        "depth": response_result["definition"]["wells"]["A1"]["depth"],
+    }
+
+
+def delay(seconds: float, minutes=0, message=None, intent="setup"):
+    return _command(
+        "waitForDuration",
+        {"seconds": seconds, "minutes": minutes, "msg": message},
+        intent,
+    )
+
+
+def delay_duration(seconds: float, minutes=0):
+    return seconds + 60 * minutes
+
+
+def pick_up_tip(
+    pipette_id: str,
+    labware_id: str,
+    well: str,
+    offset: dict = dict(x=0, y=0, z=0),
+    intent="setup",
+):
+    return _command(
+        "pickUpTip",
+        {
+            "labwareId": labware_id,
+            "wellName": well,
+            "wellLocation": {
+                "origin": "top",
+                "offset": offset,
+                "waitUntilComplete": True,
+            },
+            "pipetteId": pipette_id,
+        },
+        intent,
+    )
+
+
+def drop_tip(
+    pipette_id: str,
+    labware_id="fixedTrash",
+    well="A1",
+    offset: dict = dict(x=0, y=0, z=0),
+    intent="setup",
+):
+    return _command(
+        "dropTip",
+        {
+            "labwareId": labware_id,
+            "wellName": well,
+            "wellLocation": {
+                "origin": "top",
+                "offset": offset,
+                "waitUntilComplete": True,
+            },
+            "pipetteId": pipette_id,
+        },
+        intent,
+    )
+
+
+def _liquid_handling(
+    command_type: str,
+    pipette_id: str,
+    labware_id: str,
+    well: str,
+    depth: float,
+    offset: dict,
+    flow_rate: float,
+    intent: str,
+    volume: float = None,
+):
+    offset_depth = offset.copy()
+    offset_depth["z"] = depth + offset["z"]
+    params = {
+        "labwareId": labware_id,
+        "wellName": well,
+        "wellLocation": {
+            "origin": "top",
+            "offset": offset_depth,
+        },
+        "flowRate": flow_rate,
+    }
+    if volume is not None:
+        params["volume"] = volume
+    params["pipetteId"] = pipette_id
+    return _command(command_type, params, intent)
+
+
+def aspirate(
+    pipette_id: str,
+    labware_id: str,
+    volume: int,
+    well: str,
+    depth=-5,
+    flow_rate=100,
+    offset: dict = dict(x=0, y=0, z=0),
+    intent="setup",
+):
+    return _liquid_handling(
+        "aspirate", pipette_id, labware_id, well, depth, offset, flow_rate, intent, volume
+    )
+
+
+def dispense(
+    pipette_id: str,
+    labware_id: str,
+    volume: int,
+    well: str,
+    flow_rate: float,
+    depth=-5,
+    offset: dict = dict(x=0, y=0, z=0),
+    intent="setup",
+):
+    return _liquid_handling(
+        "dispense", pipette_id, labware_id, well, depth, offset, flow_rate, intent, volume
+    )
+
+
+def liquid_duration(volume: float, flow_rate: float):
+    return volume / flow_rate
+
+
+def blow_out(
+    pipette_id: str,
+    labware_id: str,
+    well: str,
+    depth: float = 0,
+    offset: dict = dict(x=0, y=0, z=0),
+    flow_rate=200,
+    intent="setup",
+):
+    return _liquid_handling(
+        "blowout", pipette_id, labware_id, well, depth, offset, flow_rate, intent
+    )
+
+
+def move_to_well(
+    pipette_id: str,
+    labware_id: str,
+    well: str,
+    offset: dict = dict(x=0, y=0, z=0),
+    speed=None,
+    intent="setup",
+):
+    command_dict = _command(
+        "moveToWell",
+        {
+            "labwareId": labware_id,
+            "wellName": well,
+            "wellLocation": {"origin": "top", "offset": offset},
+            "pipetteId": pipette_id,
+        },
+        intent,
+    )
+    if speed is not None:
+        command_dict["data"]["params"]["speed"] = speed
+    return command_dict
+
+
+def home():
+    """Body of POST /robot/home."""
+    return {"target": "robot"}
@@ -38,14 +38,16 @@ class DropletManager:
 
             start_time = time.time()
             while time.time() - start_time < drop_parameters["max_measure_time"]:
-                self.opentrons_api.delay(seconds=1)
+                # plot while the robot waits
+                with self.opentrons_api.non_blocking():
+                    self.opentrons_api.delay(seconds=1)
+                    dynamic_surface_tension = self.pendant_drop_camera.st_t
+                    self.plotter.plot_dynamic_surface_tension(
+                        dynamic_surface_tension=dynamic_surface_tension,
+                        well_id=source.WELL_ID,
+                        drop_count=drop_count,
+                    )
                 time.sleep(1)
-                dynamic_surface_tension = self.pendant_drop_camera.st_t
-                self.plotter.plot_dynamic_surface_tension(
-                    dynamic_surface_tension=dynamic_surface_tension,
-                    well_id=source.WELL_ID,
-                    drop_count=drop_count,
-                )
                 if dynamic_surface_tension:
                     last_st = dynamic_surface_tension[-1][1]
                     last_t = dynamic_surface_tension[-1][0]
@@ -87,33 +89,42 @@ class DropletManager:
     def _make_pendant_drop(
         self, source: Container, drop_volume: float, flow_rate: float, drop_count: int
     ):
-        self.left_pipette.pick_up_tip()
-        self.left_pipette.mixing(container=source, mix=("before", 15, 3))
-        self.left_pipette.aspirate(volume=15, source=source, flow_rate=5)
-        self.left_pipette.air_gap(air_volume=5)
-        self.left_pipette.clean_tip()
-        self.left_pipette.remove_air_gap(at_drop_stage=True)
-        self.pendant_drop_camera.initialize_measurement(
-            well_id=source.WELL_ID, drop_count=drop_count
-        )
-        self.left_pipette.dispense(
-            volume=drop_volume,
-            destination=self.containers["drop_stage"],
-            depth_offset=-23.4,  # adjust if needed
-            flow_rate=flow_rate,
-            log=False,
-            update_info=False,
-        )
+        # the camera is set up while the robot moves, the drop is complete when
+        # this returns
+        with self.opentrons_api.non_blocking():
+            self.left_pipette.pick_up_tip()
+            self.left_pipette.mixing(container=source, mix=("before", 15, 3))
+            self.left_pipette.aspirate(volume=15, source=source, flow_rate=5)
+            self.left_pipette.air_gap(air_volume=5)
+            self.left_pipette.clean_tip()
+            self.left_pipette.remove_air_gap(at_drop_stage=True)
+            self.pendant_drop_camera.initialize_measurement(
+                well_id=source.WELL_ID, drop_count=drop_count
+            )
+            self.left_pipette.dispense(
+                volume=drop_volume,
+                destination=self.containers["drop_stage"],
+                depth_offset=-23.4,  # adjust if needed
+                flow_rate=flow_rate,
+                log=False,
+                update_info=False,
+            )
 
     def _return_pendant_drop(self, source: Container, drop_volume: float):
-        self.left_pipette.aspirate(
-            volume=drop_volume,
-            source=self.containers["drop_stage"],
-            depth_offset=-23.4,
-            log=False,
-            update_info=False,
-        )  # aspirate drop in tip
-        self.logger.info("Re-aspirated the pendant drop into the tip.")
-        self.left_pipette.dispense(volume=15, destination=source)
-        self.logger.info("Returned volume in tip to source.")
-        self.left_pipette.drop_tip()
+        """
+        Queue returning the drop to its source, the robot does so while the
+        results are processed. Call sync of the OpentronsAPI before the robot
+        state matters again.
+        """
+        with self.opentrons_api.non_blocking(sync=False):
+            self.left_pipette.aspirate(
+                volume=drop_volume,
+                source=self.containers["drop_stage"],
+                depth_offset=-23.4,
+                log=False,
+                update_info=False,
+            )  # aspirate drop in tip
+            self.logger.info("Re-aspirated the pendant drop into the tip.")
+            self.left_pipette.dispense(volume=15, destination=source)
+            self.logger.info("Returned volume in tip to source.")
+            self.left_pipette.drop_tip()
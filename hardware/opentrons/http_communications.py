@@ -4,34 +4,68 @@
 # lights
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
+import threading
+import time
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from datetime import datetime
+from hardware.opentrons import commands
+from hardware.opentrons.timeline import CommandTimeline
 from utils.load_save_functions import load_settings
 from utils.logger import Logger
 
+COMMAND_POLL_INTERVAL = 0.1  # s between two polls of the queued commands
+COMMAND_PAGE_LENGTH = 200  # commands read per poll
+COMMAND_POLL_FAILURES = 10  # failed polls in a row before the robot is given up on
+SYNC_CHECK_INTERVAL = 1  # s between two checks of sync whether the robot stalled
+
 
 class OpentronsAPI:
     def __init__(self):
         settings = load_settings()
         self.ROBOT_IP_ADDRESS = settings["ROBOT_IP"]
-        self.LABWARE_DEFINITIONS_FOLDER = "labware\definitions"
-        self.HEADERS = {"opentrons-version": "3"}
+        self.CONNECT_TIMEOUT = float(settings["HTTP_CONNECT_TIMEOUT"])
+        self.READ_TIMEOUT = float(settings["HTTP_READ_TIMEOUT"])
+        self.session = self._create_session(
+            retries=int(settings["HTTP_RETRIES"]),
+            backoff_factor=float(settings["HTTP_BACKOFF_FACTOR"]),
+        )
+        self.LABWARE_DEFINITIONS_FOLDER = os.path.join("labware", "definitions")
+        self.HEADERS = commands.HEADERS
         self.PROTOCOL_ID = None
         self.RUN_ID = None
         self.COMMANDS_URL = None
         self.X_OFFSET = 0
         self.Y_OFFSET = 0
 
+        # non-blocking commands, see non_blocking
+        self.local = threading.local()  # blocking mode per thread
+        self.condition = threading.Condition()
+        self.pending = {}  # command id -> (Future, command type, sent, round trip)
+        self.queued = []  # (Future, duration) of commands queued since the last sync
+        self.command_cursor = 0  # commands of the run before this are all done
+        self.posting = 0  # non-blocking commands posted but not registered yet
+        self.finished = {}  # command id -> summary, done before it was registered
+        self.last_progress = time.monotonic()  # last time a command completed
+        self.poll_thread = None
+        self.timeline = CommandTimeline()  # round trip and robot times per command
+
     ####### protocol management #######
     def upload_protocol(self, protocol: str):
         """
         Method to upload protocol
         """
-        url = f"http://{self.ROBOT_IP_ADDRESS}:31950/protocols"
+        url = f"{commands.base_url(self.ROBOT_IP_ADDRESS)}/protocols"
         files = {"files": (protocol, open(f"{protocol}", "rb"))}
 
         try:
-            response = requests.post(url, headers=self.HEADERS, files=files)
+            response = self.session.post(
+                url, headers=self.HEADERS, files=files, timeout=self._timeout()
+            )
             if response.status_code == 201:
                 self.logger.info(
                     f"Protocol uploaded succesfully (ID: {self.PROTOCOL_ID})."
@@ -51,16 +85,21 @@ class OpentronsAPI:
         """
         Method to create a session. Uses the protocol_ID attribute to find the protocol
         """
-        url = f"http://{self.ROBOT_IP_ADDRESS}:31950/runs"
+        url = f"{commands.base_url(self.ROBOT_IP_ADDRESS)}/runs"
         protocol_id_payload = json.dumps({"data": {"protocolId": self.PROTOCOL_ID}})
-        response = requests.post(
-            url=url, headers=self.HEADERS, data=protocol_id_payload
+        response = self.session.post(
+            url=url,
+            headers=self.HEADERS,
+            data=protocol_id_payload,
+            timeout=self._timeout(),
         )
         try:
             self.RUN_ID = response.json()["data"]["id"]
+            self.command_cursor = 0
             self.COMMANDS_URL = (
-                f"http://{self.ROBOT_IP_ADDRESS}:31950/runs/{self.RUN_ID}/commands"
+                f"{commands.base_url(self.ROBOT_IP_ADDRESS)}/runs/{self.RUN_ID}/commands"
             )
+            self.timeline.start(f"{self._meta_data_dir()}/command_timeline_{self.RUN_ID}.csv")
             self.logger.info(f"Run created succesfully (ID: {self.RUN_ID}).")
         except:
             self.logger.error(f"Failed to create run! \n {response.text}")
@@ -70,21 +109,8 @@ class OpentronsAPI:
         """
         Loads pipette for a current run.
         """
-        command_dict = {
-            "data": {
-                "commandType": "loadPipette",
-                "params": {"pipetteName": name, "mount": mount},
-                "intent": "setup",
-            }
-        }
-
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
-        )
+        command_dict = commands.load_pipette(name=name, mount=mount)
+        response = self._post_command(command_dict, wait=True)
         try:
             pipette_id = response.json()["data"]["result"]["pipetteId"]
         except:
@@ -97,52 +123,17 @@ class OpentronsAPI:
         """
         loads labware for a current run.
         """
-        if custom_labware == True:
-            namespace = "custom_beta"
-        else:
-            namespace = "opentrons"
-
-        command_dict = {
-            "data": {
-                "commandType": "loadLabware",
-                "params": {
-                    "location": {"slotName": str(location)},
-                    "loadName": labware_file,
-                    "namespace": namespace,
-                    "version": 1,
-                },
-                "intent": "setup",
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.load_labware(
+            labware_file=labware_file, location=location, custom_labware=custom_labware
         )
+        response = self._post_command(command_dict, wait=True)
         try:
-            response_result = response.json()["data"]["result"]
-
-            ordering = response_result["definition"]["ordering"]
-            flatten_ordering = [
-                well for row in ordering for well in row
-            ]  # flatten ordering, column wise
-
-            labware_info = {
-                "labware_name": labware_name,
-                "labware_file": labware_file,
-                "location": location,
-                "labware_id": response_result["labwareId"],
-                "ordering": flatten_ordering,
-                "well_diameter": response_result["definition"]["wells"]["A1"][
-                    "diameter"
-                ],
-                "max_volume": response_result["definition"]["wells"]["A1"][
-                    "totalLiquidVolume"
-                ],
-                "depth": response_result["definition"]["wells"]["A1"]["depth"],
-            }
+            labware_info = commands.labware_info(
+                labware_name=labware_name,
+                labware_file=labware_file,
+                location=location,
+                response_result=response.json()["data"]["result"],
+            )
         except:
             print(
                 f"failed to load labware {labware_file} on slot {location}. \n {response.text}"
@@ -151,13 +142,14 @@ class OpentronsAPI:
 
     def add_labware_definition(self, labware_definition: str):
         labware_path = self.LABWARE_DEFINITIONS_FOLDER
-        with open(f"{labware_path}\{labware_definition}", "rb") as file:
+        with open(os.path.join(labware_path, labware_definition), "rb") as file:
             command_payload = json.dumps({"data": json.load(file)})
-        response = requests.post(
-            url=f"http://{self.ROBOT_IP_ADDRESS}:31950/runs/{self.RUN_ID}/labware_definitions",
+        response = self.session.post(
+            url=f"{commands.base_url(self.ROBOT_IP_ADDRESS)}/runs/{self.RUN_ID}/labware_definitions",
             headers=self.HEADERS,
             data=command_payload,
             params={"waitUntilComplete": True},
+            timeout=self._timeout(),
         )
 
     def add_all_labware_definitions(self):
@@ -171,34 +163,28 @@ class OpentronsAPI:
 
     ####### executable functions #######
     def home(self):
-        url = f"http://{self.ROBOT_IP_ADDRESS}:31950/robot/home"
-        command_dict = {"target": "robot"}
-        command_payload = json.dumps(command_dict)
-        response = requests.post(url=url, headers=self.HEADERS, data=command_payload)
+        url = f"{commands.base_url(self.ROBOT_IP_ADDRESS)}/robot/home"
+        command_payload = json.dumps(commands.home())
+        sent, start = datetime.now(), time.perf_counter()
+        response = self.session.post(
+            url=url, headers=self.HEADERS, data=command_payload, timeout=self._timeout()
+        )
+        self.timeline.record("home", sent, time.perf_counter() - start)
         self.logger.info("Robot homed.")
 
     def delay(self, seconds: float, minutes=0, message=None, intent="setup", log = False):
         """
         delay
         """
-        command_dict = {
-            "data": {
-                "commandType": "waitForDuration",
-                "params": {"seconds": seconds, "minutes": minutes, "msg": message},
-                "intent": intent,
-            }
-        }
-
-        command_payload = json.dumps(command_dict)
-
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.delay(
+            seconds=seconds, minutes=minutes, message=message, intent=intent
+        )
+        command = self._post_command(
+            command_dict, duration=commands.delay_duration(seconds, minutes)
         )
         if log:
             self.logger.info(f"Delay of {seconds} seconds & {minutes} minutes.")
+        return command
 
     def pick_up_tip(
         self,
@@ -209,29 +195,14 @@ class OpentronsAPI:
         intent="setup",
     ):
         "picks up tip on specified pipette"
-        command_dict = {
-            "data": {
-                "commandType": "pickUpTip",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {
-                        "origin": "top",
-                        "offset": offset,
-                        "waitUntilComplete": True,
-                    },
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.pick_up_tip(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            well=well,
+            offset=offset,
+            intent=intent,
         )
+        return self._post_command(command_dict)
 
     def drop_tip(
         self,
@@ -244,29 +215,14 @@ class OpentronsAPI:
         """
         drop tip of specified pipette
         """
-        command_dict = {
-            "data": {
-                "commandType": "dropTip",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {
-                        "origin": "top",
-                        "offset": offset,
-                        "waitUntilComplete": True,
-                    },
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.drop_tip(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            well=well,
+            offset=offset,
+            intent=intent,
         )
+        return self._post_command(command_dict)
 
     def aspirate(
         self,
@@ -282,31 +238,18 @@ class OpentronsAPI:
         """
         aspirate
         """
-        offset_depth = offset.copy()
-        offset_depth["z"] = depth + offset["z"]
-        command_dict = {
-            "data": {
-                "commandType": "aspirate",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {
-                        "origin": "top",
-                        "offset": offset_depth,
-                    },
-                    "flowRate": flow_rate,
-                    "volume": volume,
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.aspirate(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            volume=volume,
+            well=well,
+            depth=depth,
+            flow_rate=flow_rate,
+            offset=offset,
+            intent=intent,
+        )
+        return self._post_command(
+            command_dict, duration=commands.liquid_duration(volume, flow_rate)
         )
 
     def dispense(
@@ -323,31 +266,18 @@ class OpentronsAPI:
         """
         dispense
         """
-        offset_depth = offset.copy()
-        offset_depth["z"] = depth + offset["z"]
-        command_dict = {
-            "data": {
-                "commandType": "dispense",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {
-                        "origin": "top",
-                        "offset": offset_depth,
-                    },
-                    "flowRate": flow_rate,
-                    "volume": volume,
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.dispense(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            volume=volume,
+            well=well,
+            flow_rate=flow_rate,
+            depth=depth,
+            offset=offset,
+            intent=intent,
+        )
+        return self._post_command(
+            command_dict, duration=commands.liquid_duration(volume, flow_rate)
         )
 
     def blow_out(
@@ -360,30 +290,16 @@ class OpentronsAPI:
         flow_rate=200,
         intent="setup",
     ):
-        offset["z"] = depth + offset["z"]
-        command_dict = {
-            "data": {
-                "commandType": "blowout",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {
-                        "origin": "top",
-                        "offset": offset,
-                    },
-                    "flowRate": flow_rate,
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.blow_out(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            well=well,
+            depth=depth,
+            offset=offset,
+            flow_rate=flow_rate,
+            intent=intent,
         )
+        return self._post_command(command_dict)
 
     def move_to_well(
         self,
@@ -397,30 +313,284 @@ class OpentronsAPI:
         """
         move to
         """
-
-        command_dict = {
-            "data": {
-                "commandType": "moveToWell",
-                "params": {
-                    "labwareId": labware_id,
-                    "wellName": well,
-                    "wellLocation": {"origin": "top", "offset": offset},
-                    "pipetteId": pipette_id,
-                },
-                "intent": intent,
-            }
-        }
-        if speed is not None:
-            command_dict["data"]["params"]["speed"] = speed
-        command_payload = json.dumps(command_dict)
-        response = requests.post(
-            url=self.COMMANDS_URL,
-            headers=self.HEADERS,
-            data=command_payload,
-            params={"waitUntilComplete": True},
+        command_dict = commands.move_to_well(
+            pipette_id=pipette_id,
+            labware_id=labware_id,
+            well=well,
+            offset=offset,
+            speed=speed,
+            intent=intent,
         )
+        return self._post_command(command_dict)
 
     ####### utils #######
+    def _create_session(self, retries: int, backoff_factor: float):
+        """
+        Session that keeps its connection to the robot alive between commands.
+
+        Only requests that never reached the robot (connection errors) and
+        idempotent requests (GET) are retried, a command that may have been
+        executed, e.g. an aspirate, is never sent twice.
+        """
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            other=0,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # not POST
+            status_forcelist=(502, 503, 504),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        return session
+
+    def _timeout(self, duration: float = 0):
+        """
+        (connect, read) timeout of a request in s.
+
+        :param duration: time the robot takes to execute the command, the
+            response of a command that waits until complete only comes after it
+        """
+        return (self.CONNECT_TIMEOUT, self.READ_TIMEOUT + duration)
+
+    def _post_command(self, command_dict: dict, duration: float = 0, wait=None):
+        """
+        Post a command to the current run. In blocking mode wait until it is
+        complete and return the response, in non-blocking mode queue it and
+        return a Future of its command summary.
+
+        :param command_dict: command in the format of the HTTP API
+        :param duration: time the robot takes to execute the command in s
+        :param wait: True to wait even in non-blocking mode, e.g. when the
+            result of the command is needed
+        """
+        if wait is None:
+            wait = getattr(self.local, "blocking", True)
+        if wait:
+            return self._send_command(command_dict, duration, wait=True)[0]
+
+        # the command can be done before its response arrives, the poller keeps
+        # the summaries of finished commands while a command is being posted
+        with self.condition:
+            self.posting += 1
+        try:
+            response, command_type, sent, round_trip = self._send_command(
+                command_dict, duration, wait=False
+            )
+            if response.status_code != 201:
+                raise RuntimeError(
+                    f"Command {command_type} was not queued: {response.text}"
+                )
+            command_id = response.json()["data"]["id"]
+            future = Future()
+            with self.condition:
+                finished = self.finished.pop(command_id, None)
+                if finished is None:
+                    self.pending[command_id] = (future, command_type, sent, round_trip)
+                self.queued.append((future, duration))
+                if self.poll_thread is None:
+                    self.poll_thread = threading.Thread(
+                        target=self._poll_commands, daemon=True
+                    )
+                    self.poll_thread.start()
+                self.condition.notify_all()
+        finally:
+            with self.condition:
+                self.posting -= 1
+                if not self.posting:
+                    self.finished.clear()
+        if finished is not None:
+            self._resolve(future, command_type, sent, round_trip, finished)
+        return future
+
+    def _send_command(self, command_dict: dict, duration: float, wait: bool):
+        """
+        POST a command, commands that wait are recorded in the timeline.
+
+        :return: response, command type, time sent and round trip in s
+        """
+        command_type = command_dict["data"]["commandType"]
+        sent, start = datetime.now(), time.perf_counter()
+        try:
+            response = self.session.post(
+                url=self.COMMANDS_URL,
+                headers=self.HEADERS,
+                data=json.dumps(command_dict),
+                params={"waitUntilComplete": wait},
+                timeout=self._timeout(duration if wait else 0),
+            )
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Command {command_type} failed: {e}")
+            raise
+        round_trip = time.perf_counter() - start
+        if wait:
+            try:
+                summary = response.json()["data"]
+            except (ValueError, KeyError):
+                summary = None
+            self.timeline.record(command_type, sent, round_trip, summary)
+        return response, command_type, sent, round_trip
+
+    ####### non-blocking commands #######
+    @contextmanager
+    def non_blocking(self, sync: bool = True):
+        """
+        Queue the commands posted by this thread in the block on the robot
+        instead of waiting for each of them, so the host can plot, save or set
+        up the analysis while the robot moves. The robot executes the commands in
+        order, the action methods return a Future of the command summary.
+
+        :param sync: wait for the queued commands at the end of the block,
+            otherwise call sync where the commands have to be complete
+        """
+        blocking = getattr(self.local, "blocking", True)
+        self.local.blocking = False
+        try:
+            yield
+        finally:
+            self.local.blocking = blocking
+        if sync:
+            self.sync()
+
+    def sync(self, timeout: float = None):
+        """
+        Wait until all commands queued so far are complete, as long as the robot
+        keeps completing commands.
+
+        :param timeout: maximum time in s without any command completing,
+            defaults to the longest expected duration of the queued commands
+            plus the read timeout
+        :return: command summaries of the queued commands
+        """
+        with self.condition:
+            queued, self.queued = self.queued, []
+        futures = [future for future, _ in queued]
+        if timeout is None:
+            timeout = max((d for _, d in queued), default=0) + self.READ_TIMEOUT
+        start = time.monotonic()
+        while True:
+            done, not_done = wait(futures, timeout=SYNC_CHECK_INTERVAL)
+            if not not_done:
+                break
+            stalled = time.monotonic() - max(start, self.last_progress)
+            if stalled > timeout:
+                raise TimeoutError(
+                    f"{len(not_done)} robot commands are not complete, no command "
+                    f"completed for {stalled:.0f} s"
+                )
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
+
+    def _poll_commands(self):
+        """
+        Resolve the Futures of queued commands, all commands of the run from the
+        cursor on are read in one request. When the robot cannot be polled
+        COMMAND_POLL_FAILURES times in a row the pending Futures fail.
+        """
+        failures = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending)
+            time.sleep(COMMAND_POLL_INTERVAL)
+            try:
+                response = self.session.get(
+                    url=self.COMMANDS_URL,
+                    headers=self.HEADERS,
+                    params={
+                        "cursor": self.command_cursor,
+                        "pageLength": COMMAND_PAGE_LENGTH,
+                    },
+                    timeout=self._timeout(),
+                )
+                page = response.json()
+                summaries = page["data"]
+                cursor = page["meta"]["cursor"]
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                self.logger.warning(f"Failed to poll robot commands: {e}")
+                failures += 1
+                if failures >= COMMAND_POLL_FAILURES:
+                    self._fail_pending(
+                        ConnectionError(
+                            f"Robot commands could not be polled {failures} times: {e}"
+                        )
+                    )
+                    failures = 0
+                continue
+            failures = 0
+
+            resolved = []
+            with self.condition:
+                finished = True  # all commands so far on the page are done
+                for i, summary in enumerate(summaries):
+                    done = summary["status"] in ("succeeded", "failed")
+                    finished = finished and done
+                    if finished:
+                        self.command_cursor = cursor + i + 1
+                        self.last_progress = time.monotonic()
+                    if not done:
+                        continue
+                    if summary["id"] in self.pending:
+                        resolved.append((*self.pending.pop(summary["id"]), summary))
+                    elif self.posting:
+                        # may be a queued command whose response is on its way
+                        self.finished[summary["id"]] = summary
+            for future, command_type, sent, round_trip, summary in resolved:
+                self._resolve(future, command_type, sent, round_trip, summary)
+
+    def _resolve(
+        self, future: Future, command_type: str, sent, round_trip: float, summary: dict
+    ):
+        """Complete the Future of a queued command from its command summary."""
+        self.timeline.record(command_type, sent, round_trip, summary, queued=True)
+        if summary["status"] == "failed":
+            future.set_exception(
+                RuntimeError(f"Command {command_type} failed: {summary.get('error')}")
+            )
+        else:
+            future.set_result(summary)
+
+    def _fail_pending(self, exception: Exception):
+        """Fail the Futures of all queued commands that are not complete."""
+        with self.condition:
+            pending, self.pending = self.pending, {}
+        self.logger.error(f"{len(pending)} queued robot commands failed: {exception}")
+        for future, *_ in pending.values():
+            future.set_exception(exception)
+
+    def save_command_summary(self):
+        """
+        Save the time spent per command type of the current run next to its
+        command timeline.
+        """
+        summary = self.timeline.summary()
+        if summary.empty:
+            return
+        summary.to_csv(f"{self._meta_data_dir()}/command_summary_{self.RUN_ID}.csv")
+        for row in ("all blocking", "all queued"):
+            if row not in summary.index:
+                continue
+            commands_row = summary.loc[row]
+            self.logger.info(
+                f"Robot commands ({row.split()[1]}): {int(commands_row['count'])} "
+                f"commands, {commands_row['total round trip (s)']:.1f} s round trip, "
+                f"{commands_row['total execution (s)']:.1f} s executing on the robot."
+            )
+
+    def close(self):
+        """Close the connections to the robot."""
+        self.session.close()
+        self.timeline.close()
+
+    def _meta_data_dir(self):
+        settings = load_settings()
+        return f'experiments/{settings["EXPERIMENT_NAME"]}/meta_data'
+
     def _initialize_logger(self):
         settings = load_settings()
         self.logger = Logger(
@@ -430,7 +600,9 @@ class OpentronsAPI:
 
     def initialise(self):
         self._initialize_logger()
-        self.upload_protocol(protocol="hardware\opentrons\protocol_placeholder.py")
+        self.upload_protocol(
+            protocol=os.path.join("hardware", "opentrons", "protocol_placeholder.py")
+        )
         self.create_run()
         self.add_all_labware_definitions()
 
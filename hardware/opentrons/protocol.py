@@ -55,7 +55,9 @@ class Protocol:
         pipettes = self.config.load_pipettes()
         self.right_pipette = pipettes["right"]
         self.left_pipette = pipettes["left"]
-        self.n_measurement_in_eq = 100  # number of data points which is averaged for equillibrium surface tension
+        self.eq_time_window = float(
+            self.settings["EQUILIBRIUM_WINDOW"]
+        )  # last seconds of the measurement which are averaged for equillibrium surface tension
         self.results = initialize_results()
         self.plotter = Plotter()
         self.droplet_manager = DropletManager(
@@ -83,8 +85,10 @@ class Protocol:
             calibrate=True,
         )
         save_calibration_data(scale_t)
+        self.opentrons_api.sync()
         average_scale = calculate_average_in_column(x=scale_t, column_index=1)
         self.logger.info(f"Finished calibration, average scale is: {average_scale}")
+        self.opentrons_api.save_command_summary()
         play_sound("Calibration done.")
 
     def measure_wells(self):
@@ -108,14 +112,16 @@ class Protocol:
                 dynamic_surface_tension=dynamic_surface_tension,
                 well_id=well_id,
                 drop_parameters=drop_parameters,
-                n_eq_points=self.n_measurement_in_eq,
+                eq_time_window=self.eq_time_window,
                 containers=self.containers,
                 sensor_api=self.sensor_api,
             )
             self.plotter.plot_results_well_id(df=self.results)
             save_results(results=self.results)
+            self.opentrons_api.sync()  # drop returned to the well
 
         self.logger.info("Finished measure wells protocol.")
+        self.opentrons_api.save_command_summary()
         play_sound("DATA DATA.")
 
     def characterize_surfactant(self):
@@ -155,7 +161,7 @@ class Protocol:
                     dynamic_surface_tension=dynamic_surface_tension,
                     well_id=well_id,
                     drop_parameters=drop_parameters,
-                    n_eq_points=self.n_measurement_in_eq,
+                    eq_time_window=self.eq_time_window,
                     containers=self.containers,
                     sensor_api=self.sensor_api,
                 )
@@ -163,8 +169,10 @@ class Protocol:
                 self.plotter.plot_results_concentration(
                     df=self.results, solution_name=surfactant
                 )
+                self.opentrons_api.sync()  # drop returned to the well
 
         self.logger.info("Finished characterization protocol.")
+        self.opentrons_api.save_command_summary()
         play_sound("DATA DATA.")
 
     def measure_same_well(self, well_id: str, repeat: int = 3):
@@ -185,3 +193,5 @@ class Protocol:
             df.to_csv(
                 f"experiments/{self.settings['EXPERIMENT_NAME']}/data/{well_id}/dynamic_surface_tension_{i}.csv"
             )
+            self.opentrons_api.sync()  # drop returned to the well
+        self.opentrons_api.save_command_summary()
@@ -0,0 +1,484 @@
+"""
+Stand-in for the HTTP API of an OT-2, to run and profile whole protocols without
+a robot. It serves the endpoints OpentronsAPI and AsyncOpentronsAPI use:
+
+- POST /protocols
+- POST /runs
+- POST, GET /runs/{id}/commands
+- POST /runs/{id}/labware_definitions
+- POST /robot/home
+
+Commands are executed one at a time per run, like on the robot, and take the
+time the robot would take: moves from the deck geometry of the loaded labware
+and the gantry speeds, aspirating and dispensing from the volume and flow rate.
+Labware is defined by the definitions the client uploads, by labware/definitions,
+or else by a generic well plate derived from its load name.
+
+Run with ROBOT_IP set to 127.0.0.1:
+
+    python -m hardware.opentrons.simulator --time-scale 0.1
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import Flask, jsonify, request
+
+from hardware.opentrons import commands
+
+LABWARE_DEFINITIONS_FOLDER = os.path.join("labware", "definitions")
+
+# deck geometry of the OT-2 in mm, slot 1 is front left
+SLOT_PITCH = (132.5, 90.5)
+HOME_POSITION = (418.0, 353.0, 218.0)
+TRASH_POSITION = (347.0, 351.0, 82.0)  # top of the fixed trash in slot 12
+CLEARANCE = 10.0  # height above the highest labware the gantry travels at
+
+# speeds in mm/s and fixed times in s
+XY_SPEED = 400.0
+Z_SPEED = 125.0
+MOVE_OVERHEAD = 0.05  # acceleration and settling per straight move
+PICK_UP_TIP_TIME = 2.0
+DROP_TIP_TIME = 1.5
+BLOW_OUT_TIME = 0.5
+HOME_TIME = 10.0
+
+# generic labware for load names without a definition: wells -> rows, columns, pitch
+GENERIC_FORMATS = {
+    6: (2, 3, 39.12),
+    12: (3, 4, 26.01),
+    24: (4, 6, 19.3),
+    48: (6, 8, 13.08),
+    96: (8, 12, 9.0),
+    384: (16, 24, 4.5),
+}
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def slot_origin(slot_name: str):
+    slot = int(slot_name) - 1
+    return (slot % 3) * SLOT_PITCH[0], (slot // 3) * SLOT_PITCH[1]
+
+
+def generic_definition(load_name: str, namespace: str):
+    """
+    Definition of a well plate, tip rack or reservoir from a load name like
+    opentrons_96_tiprack_300ul, for labware that is not in labware/definitions.
+    """
+    match = re.search(r"_(\d+)_", load_name)
+    n_wells = int(match.group(1)) if match else 96
+    rows, columns, pitch = GENERIC_FORMATS.get(n_wells, (1, n_wells, 9.0))
+    match = re.search(r"(\d+)(ul|ml)", load_name)
+    volume = 200.0
+    if match:
+        volume = float(match.group(1)) * (1000 if match.group(2) == "ml" else 1)
+    is_tiprack = "tiprack" in load_name
+    height = 64.5 if is_tiprack else 14.5
+
+    wells = {}
+    ordering = []
+    for column in range(columns):
+        ordering.append([])
+        for row in range(rows):
+            well = f"{chr(ord('A') + row)}{column + 1}"
+            ordering[-1].append(well)
+            wells[well] = {
+                "depth": height - 3,
+                "totalLiquidVolume": volume,
+                "shape": "circular",
+                "diameter": min(pitch * 0.75, 50),
+                "x": 14.38 + column * pitch,
+                "y": 74.24 - row * pitch,
+                "z": 3.0,
+            }
+    parameters = {
+        "format": "irregular",
+        "isTiprack": is_tiprack,
+        "loadName": load_name,
+    }
+    if is_tiprack:
+        parameters["tipLength"] = 59.3
+    return {
+        "ordering": ordering,
+        "dimensions": {"xDimension": 127.76, "yDimension": 85.48, "zDimension": height},
+        "wells": wells,
+        "parameters": parameters,
+        "namespace": namespace,
+        "version": 1,
+        "schemaVersion": 2,
+        "cornerOffsetFromSlot": {"x": 0, "y": 0, "z": 0},
+    }
+
+
+class CommandFailed(Exception):
+    def __init__(self, error_type: str, detail: str):
+        super().__init__(detail)
+        self.error_type = error_type
+        self.detail = detail
+
+
+class SimulatedRun:
+    """
+    Commands of a run, executed in order on a thread of the run.
+    """
+
+    def __init__(self, protocol_id: str, time_scale: float):
+        self.id = str(uuid.uuid4())
+        self.protocol_id = protocol_id
+        self.time_scale = time_scale
+        self.created_at = now()
+        self.definitions = {}  # load name -> uploaded labware definition
+        self.labware = {}  # labware id -> {"definition", "slot"}
+        self.pipettes = {}  # pipette id -> {"name", "mount", "position", "tip"}
+        self.commands = []  # summaries in order of creation
+        self.done = {}  # command id -> Event, set when the command is complete
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._execute_commands, daemon=True)
+        self.thread.start()
+
+    def summary(self):
+        with self.lock:
+            status = "running" if any(
+                command["status"] in ("queued", "running") for command in self.commands
+            ) else "idle"
+            return {
+                "id": self.id,
+                "protocolId": self.protocol_id,
+                "createdAt": self.created_at,
+                "status": status,
+                "current": True,
+                "actions": [],
+                "errors": [],
+                "pipettes": [
+                    {"id": pipette_id, "pipetteName": p["name"], "mount": p["mount"]}
+                    for pipette_id, p in self.pipettes.items()
+                ],
+                "labware": [
+                    {
+                        "id": labware_id,
+                        "loadName": l["definition"]["parameters"]["loadName"],
+                        "location": {"slotName": l["slot"]},
+                    }
+                    for labware_id, l in self.labware.items()
+                ],
+            }
+
+    def add_command(self, data: dict):
+        command_id = str(uuid.uuid4())
+        command = {
+            "id": command_id,
+            "key": command_id,
+            "commandType": data["commandType"],
+            "createdAt": now(),
+            "startedAt": None,
+            "completedAt": None,
+            "status": "queued",
+            "params": data.get("params", {}),
+            "result": None,
+            "error": None,
+            "intent": data.get("intent", "setup"),
+        }
+        with self.lock:
+            self.commands.append(command)
+            self.done[command_id] = threading.Event()
+        self.queue.put(command)
+        return command
+
+    def _execute_commands(self):
+        while True:
+            command = self.queue.get()
+            with self.lock:
+                command["status"] = "running"
+                command["startedAt"] = now()
+            try:
+                with self.lock:
+                    result, duration = self._execute(
+                        command["commandType"], command["params"]
+                    )
+                time.sleep(duration * self.time_scale)
+                error = None
+            except Exception as e:
+                # a malformed command fails like on the robot, the run goes on
+                if not isinstance(e, CommandFailed):
+                    e = CommandFailed("UnexpectedProtocolError", repr(e))
+                result = None
+                error = {
+                    "id": str(uuid.uuid4()),
+                    "errorType": e.error_type,
+                    "createdAt": now(),
+                    "detail": e.detail,
+                }
+            with self.lock:
+                command["result"] = result
+                command["error"] = error
+                command["status"] = "failed" if error else "succeeded"
+                command["completedAt"] = now()
+                self.done[command["id"]].set()
+
+    ####### commands #######
+    def _execute(self, command_type: str, params: dict):
+        """
+        Change the state of the run for a command.
+
+        :return: result of the command and the time it takes the robot in s
+        """
+        if command_type == "loadPipette":
+            pipette_id = str(uuid.uuid4())
+            self.pipettes[pipette_id] = {
+                "name": params["pipetteName"],
+                "mount": params["mount"],
+                "position": HOME_POSITION,
+                "tip": False,
+            }
+            return {"pipetteId": pipette_id}, 0
+        if command_type == "loadLabware":
+            return self._load_labware(params), 0
+        if command_type == "waitForDuration":
+            return {}, params.get("seconds", 0) + 60 * params.get("minutes", 0)
+
+        pipette = self._pipette(params.get("pipetteId"))
+        if command_type == "moveToWell":
+            return self._move_to_well(pipette, params)
+        if command_type == "pickUpTip":
+            if pipette["tip"]:
+                raise CommandFailed("TipAttachedError", "pipette already has a tip")
+            result, duration = self._move_to_well(pipette, params)
+            pipette["tip"] = True
+            return result, duration + PICK_UP_TIP_TIME
+        if command_type == "dropTip":
+            if params.get("labwareId") == "fixedTrash":
+                duration = self._move(pipette, TRASH_POSITION)
+                result = {"position": self._position(TRASH_POSITION)}
+            else:
+                result, duration = self._move_to_well(pipette, params)
+            pipette["tip"] = False
+            return result, duration + DROP_TIP_TIME
+        if command_type in ("aspirate", "dispense", "blowout"):
+            if not pipette["tip"]:
+                raise CommandFailed(
+                    "TipNotAttachedError", f"{command_type} without a tip"
+                )
+            result, duration = self._move_to_well(pipette, params)
+            if command_type == "blowout":
+                return result, duration + BLOW_OUT_TIME
+            result["volume"] = params["volume"]
+            return result, duration + commands.liquid_duration(
+                params["volume"], params["flowRate"]
+            )
+        raise CommandFailed(
+            "UnexpectedProtocolError", f"command {command_type} is not simulated"
+        )
+
+    def _load_labware(self, params: dict):
+        load_name = params["loadName"]
+        definition = self.definitions.get(load_name)
+        file_path = os.path.join(LABWARE_DEFINITIONS_FOLDER, f"{load_name}.json")
+        if definition is None and os.path.exists(file_path):
+            with open(file_path) as file:
+                definition = json.load(file)
+        if definition is None:
+            if params.get("namespace") == "custom_beta":
+                raise CommandFailed(
+                    "LabwareDefinitionDoesNotExistError",
+                    f"custom labware {load_name} was not uploaded",
+                )
+            definition = generic_definition(load_name, params.get("namespace"))
+        labware_id = str(uuid.uuid4())
+        self.labware[labware_id] = {
+            "definition": definition,
+            "slot": params["location"]["slotName"],
+        }
+        return {"labwareId": labware_id, "definition": definition, "offsetId": None}
+
+    def _pipette(self, pipette_id: str):
+        if pipette_id not in self.pipettes:
+            raise CommandFailed("PipetteNotLoadedError", f"no pipette {pipette_id}")
+        return self.pipettes[pipette_id]
+
+    ####### motion #######
+    def _well_position(self, params: dict):
+        labware = self.labware.get(params.get("labwareId"))
+        if labware is None:
+            raise CommandFailed(
+                "LabwareNotLoadedError", f"no labware {params.get('labwareId')}"
+            )
+        definition = labware["definition"]
+        well = definition["wells"].get(params.get("wellName"))
+        if well is None:
+            raise CommandFailed(
+                "WellDoesNotExistError", f"no well {params.get('wellName')}"
+            )
+        x, y = slot_origin(labware["slot"])
+        corner = definition.get("cornerOffsetFromSlot", {"x": 0, "y": 0, "z": 0})
+        offset = params.get("wellLocation", {}).get("offset", {})
+        return (
+            x + corner["x"] + well["x"] + offset.get("x", 0),
+            y + corner["y"] + well["y"] + offset.get("y", 0),
+            corner["z"] + well["z"] + well["depth"] + offset.get("z", 0),
+        )
+
+    def _travel_height(self):
+        heights = [
+            labware["definition"]["dimensions"]["zDimension"]
+            for labware in self.labware.values()
+        ]
+        return min(max(heights, default=0) + CLEARANCE, HOME_POSITION[2])
+
+    def _move(self, pipette: dict, target: tuple, speed: float = None):
+        """
+        Move a pipette, up to the travel height, across and down unless it stays
+        above the same spot. Returns the time it takes in s.
+        """
+        xy_speed = XY_SPEED if speed is None else min(speed, XY_SPEED)
+        z_speed = Z_SPEED if speed is None else min(speed, Z_SPEED)
+        x, y, z = pipette["position"]
+        distance = math.hypot(target[0] - x, target[1] - y)
+        pipette["position"] = target
+        if distance < 1e-6:
+            return abs(target[2] - z) / z_speed + MOVE_OVERHEAD
+        travel = max(self._travel_height(), z, target[2])
+        return (
+            (travel - z) / z_speed
+            + distance / xy_speed
+            + (travel - target[2]) / z_speed
+            + 3 * MOVE_OVERHEAD
+        )
+
+    def _move_to_well(self, pipette: dict, params: dict):
+        target = self._well_position(params)
+        duration = self._move(pipette, target, params.get("speed"))
+        return {"position": self._position(target)}, duration
+
+    @staticmethod
+    def _position(position: tuple):
+        return dict(zip("xyz", (round(value, 2) for value in position)))
+
+    def home(self):
+        with self.lock:
+            for pipette in self.pipettes.values():
+                pipette["position"] = HOME_POSITION
+
+
+def create_app(time_scale: float = 1.0):
+    """
+    :param time_scale: factor on the time commands take, 0 executes them at once
+    """
+    app = Flask(__name__)
+    protocols = {}  # content hash -> protocol
+    runs = {}
+
+    def error(status: int, error_id: str, detail: str):
+        return jsonify({"errors": [{"id": error_id, "title": error_id, "detail": detail}]}), status
+
+    def find_run(run_id: str):
+        return runs.get(run_id)
+
+    @app.route("/protocols", methods=["POST"])
+    def upload_protocol():
+        files = request.files.getlist("files")
+        if not files:
+            return error(422, "NoFiles", "no protocol files")
+        contents = [file.read() for file in files]
+        key = hashlib.sha256(b"".join(contents)).hexdigest()
+        if key in protocols:
+            return jsonify({"data": protocols[key]}), 200
+        protocols[key] = {
+            "id": str(uuid.uuid4()),
+            "createdAt": now(),
+            "protocolType": "python",
+            "files": [{"name": file.filename, "role": "main"} for file in files],
+        }
+        return jsonify({"data": protocols[key]}), 201
+
+    @app.route("/runs", methods=["POST"])
+    def create_run():
+        data = (request.get_json(force=True, silent=True) or {}).get("data", {})
+        run = SimulatedRun(data.get("protocolId"), time_scale)
+        runs[run.id] = run
+        return jsonify({"data": run.summary()}), 201
+
+    @app.route("/runs/<run_id>/labware_definitions", methods=["POST"])
+    def add_labware_definition(run_id):
+        run = find_run(run_id)
+        if run is None:
+            return error(404, "RunNotFound", f"no run {run_id}")
+        definition = request.get_json(force=True)["data"]
+        load_name = definition["parameters"]["loadName"]
+        run.definitions[load_name] = definition
+        return jsonify(
+            {
+                "data": {
+                    "definitionUri": f"{definition.get('namespace')}/{load_name}/{definition.get('version')}"
+                }
+            }
+        ), 201
+
+    @app.route("/runs/<run_id>/commands", methods=["POST"])
+    def post_command(run_id):
+        run = find_run(run_id)
+        if run is None:
+            return error(404, "RunNotFound", f"no run {run_id}")
+        command = run.add_command(request.get_json(force=True)["data"])
+        if request.args.get("waitUntilComplete", "false").lower() == "true":
+            timeout = request.args.get("timeout")
+            run.done[command["id"]].wait(
+                None if timeout is None else float(timeout) / 1000
+            )
+        with run.lock:
+            return jsonify({"data": dict(command)}), 201
+
+    @app.route("/runs/<run_id>/commands", methods=["GET"])
+    def get_commands(run_id):
+        run = find_run(run_id)
+        if run is None:
+            return error(404, "RunNotFound", f"no run {run_id}")
+        page_length = int(request.args.get("pageLength", 20))
+        with run.lock:
+            total = len(run.commands)
+            cursor = request.args.get("cursor")
+            cursor = max(total - page_length, 0) if cursor is None else int(cursor)
+            page = [
+                {key: value for key, value in command.items() if key != "result"}
+                for command in run.commands[cursor : cursor + page_length]
+            ]
+        return jsonify({"data": page, "meta": {"cursor": cursor, "totalLength": total}})
+
+    @app.route("/robot/home", methods=["POST"])
+    def home():
+        time.sleep(HOME_TIME * time_scale)
+        for run in runs.values():
+            run.home()
+        return jsonify({"message": "Homing robot."}), 200
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Opentrons HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=commands.PORT)
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="factor on the time commands take, 0 executes them at once",
+    )
+    args = parser.parse_args()
+    create_app(args.time_scale).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
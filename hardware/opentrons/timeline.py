@@ -0,0 +1,159 @@
+"""
+Timeline of the commands sent to the robot, to find out how much of a run is
+HTTP overhead, waiting in the robot's queue and executing on the robot.
+
+For every command the round trip of its request is measured on the host and
+createdAt, startedAt and completedAt are taken from the command summary of the
+robot. Only differences of robot times are used, the clocks of host and robot
+are not compared.
+"""
+
+import csv
+import math
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+COLUMNS = [
+    "command type",
+    "command id",
+    "queued",
+    "status",
+    "sent",
+    "round trip (s)",
+    "created at",
+    "started at",
+    "completed at",
+    "waiting (s)",
+    "execution (s)",
+    "overhead (s)",
+]
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class CommandTimeline:
+    def __init__(self):
+        self.rows = []
+        self.file = None
+        self.writer = None
+        self.lock = threading.Lock()  # commands are recorded by the polling thread too
+
+    def start(self, file_path: str):
+        """
+        Start the timeline of a run, every command is appended to the csv file
+        as soon as it is recorded.
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.rows = []
+            self.file = open(file_path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+            self.file.flush()
+
+    def record(
+        self,
+        command_type: str,
+        sent: datetime,
+        round_trip: float,
+        summary: dict = None,
+        queued: bool = False,
+    ):
+        """
+        Record a command.
+
+        :param command_type: commandType, or the endpoint for other requests
+        :param sent: wall clock time the request was sent
+        :param round_trip: duration of the request in s
+        :param summary: command summary returned by the robot, if any
+        :param queued: the command was queued without waiting, its round trip
+            then only covers queueing and the summary comes from polling
+        """
+        summary = summary or {}
+        created_at = _parse_time(summary.get("createdAt"))
+        started_at = _parse_time(summary.get("startedAt"))
+        completed_at = _parse_time(summary.get("completedAt"))
+        waiting = execution = overhead = math.nan
+        if created_at and started_at:
+            waiting = (started_at - created_at).total_seconds()
+        if started_at and completed_at:
+            execution = (completed_at - started_at).total_seconds()
+        if created_at and completed_at and not queued:
+            # time of the request that the robot did not spend on the command
+            overhead = round_trip - (completed_at - created_at).total_seconds()
+
+        row = [
+            command_type,
+            summary.get("id"),
+            queued,
+            summary.get("status"),
+            sent.isoformat(),
+            round_trip,
+            summary.get("createdAt"),
+            summary.get("startedAt"),
+            summary.get("completedAt"),
+            waiting,
+            execution,
+            overhead,
+        ]
+        with self.lock:
+            self.rows.append(row)
+            if self.writer is not None:
+                self.writer.writerow(row)
+                self.file.flush()
+
+    def dataframe(self):
+        with self.lock:
+            return pd.DataFrame(self.rows, columns=COLUMNS)
+
+    def summary(self):
+        """
+        Time spent per command type.
+
+        :return: DataFrame with one row per command type, queued commands of a
+            type in a row of their own, and one for all blocking and one for all
+            queued commands, with the count and the total and mean round trip,
+            waiting, execution and overhead in s. The round trip of a queued
+            command only covers queueing it, so blocking and queued commands are
+            never added up; durations unknown for all commands of a row are NaN
+        """
+        timeline = self.dataframe()
+        durations = ["round trip (s)", "waiting (s)", "execution (s)", "overhead (s)"]
+        if timeline.empty:
+            return pd.DataFrame()
+        command_types = timeline["command type"].where(
+            ~timeline["queued"], timeline["command type"] + " (queued)"
+        )
+        grouped = timeline.groupby(command_types)[durations]
+        summary = pd.concat(
+            [
+                grouped.size().rename("count"),
+                grouped.sum(min_count=1).add_prefix("total "),
+                grouped.mean().add_prefix("mean "),
+            ],
+            axis=1,
+        )
+        summary = summary.sort_values("total round trip (s)", ascending=False)
+        for queued, rows in timeline.groupby("queued"):
+            summary.loc["all queued" if queued else "all blocking"] = [
+                len(rows),
+                *rows[durations].sum(min_count=1),
+                *rows[durations].mean(),
+            ]
+        summary["count"] = summary["count"].astype(int)
+        summary.index.name = "command type"
+        return summary
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = None
+            self.writer = None
@@ -1,4 +1,6 @@
-from server.routes import app
-
 if __name__ == "__main__":
+    # imported here, so the analysis worker processes (which import this module
+    # when they are spawned) do not start the server and open the cameras again
+    from server.routes import app
+
     app.run(debug=False, host="0.0.0.0", port=5000)
@@ -266,6 +266,28 @@ def status():
     return jsonify({"status": status})
 
 
+@app.route("/pendant_drop_timings")
+def pendant_drop_timings():
+    return jsonify(pendant_drop_camera.analysis_timings())
+
+
+@app.route("/pendant_drop_frames")
+def pendant_drop_frames():
+    return jsonify(pendant_drop_camera.frame_statistics())
+
+
+@app.route("/pendant_drop_rejections")
+def pendant_drop_rejections():
+    return jsonify(pendant_drop_camera.rejection_counts())
+
+
+@app.route("/robot_command_timings")
+def robot_command_timings():
+    summary = opentrons_api.timeline.summary()
+    summary = summary.astype(object).where(summary.notna(), None)  # NaN is not json
+    return jsonify(summary.to_dict(orient="index"))
+
+
 @app.route("/pendant_drop_plot_feed")
 def pendant_drop_plot_feed():
     pendant_drop_camera.start_plot_frame_thread()
@@ -4,7 +4,7 @@ import csv
 import subprocess
 import pandas as pd
 
-from utils.utils import calculate_equillibrium_value
+from utils.utils import calculate_equillibrium_value_in_window
 from hardware.sensor.sensor_api import SensorAPI
 
 
@@ -58,6 +58,12 @@ def save_settings_meta_data(settings: dict):
         json.dump(settings, file, indent=4)
 
 
+def load_settings_meta_data(experiment_name: str):
+    file_path = f"experiments/{experiment_name}/meta_data/settings.json"
+    with open(file_path, "r") as file:
+        return json.load(file)
+
+
 def save_instances_to_csv(instances, filename):
     # Get the attribute names from the first instance
     fieldnames = [attr for attr in vars(instances[0])]
@@ -109,15 +115,15 @@ def append_results(
     dynamic_surface_tension: list,
     well_id: str,
     drop_parameters: dict,
-    n_eq_points: int,
+    eq_time_window: float,
     containers: list,
     sensor_api: SensorAPI,
 ):
     if dynamic_surface_tension:
         save_dynamic_surface_tension(dynamic_surface_tension, well_id)
-        st_eq = calculate_equillibrium_value(
+        st_eq = calculate_equillibrium_value_in_window(
             x=dynamic_surface_tension,
-            n_eq_points=n_eq_points,
+            time_window=eq_time_window,
             column_index=1,
         )
         results = add_data_to_results(
@@ -133,13 +139,14 @@ def append_results(
     return results
 
 
-def save_dynamic_surface_tension(dynamic_surface_tension, well_id):
-    settings = load_settings()
+def save_dynamic_surface_tension(dynamic_surface_tension, well_id, experiment_name=None):
+    if experiment_name is None:
+        experiment_name = load_settings()["EXPERIMENT_NAME"]
     df = pd.DataFrame(
         dynamic_surface_tension, columns=["time (s)", "surface tension (mN/m)"]
     )
     df.to_csv(
-        f"experiments/{settings['EXPERIMENT_NAME']}/data/{well_id}/dynamic_surface_tension.csv"
+        f"experiments/{experiment_name}/data/{well_id}/dynamic_surface_tension.csv"
     )
 
 
@@ -179,6 +186,27 @@ def save_results(results: pd.DataFrame):
     results.to_csv(file_name_results, index=False)
 
 
+def update_results_surface_tension(experiment_name: str, surface_tensions_eq: dict):
+    """
+    Overwrite the equilibrium surface tension of wells in an existing results.csv
+
+    :param experiment_name: Experiment name
+    :param surface_tensions_eq: Dictionary of well id -> equilibrium surface tension
+
+    :return: Updated results, or None if the experiment has no results.csv
+    """
+    file_name_results = f"experiments/{experiment_name}/results.csv"
+    if not os.path.exists(file_name_results):
+        return None
+    results = pd.read_csv(file_name_results)
+    well_ids = results["well id"].astype(str)
+    results["surface tension eq. (mN/m)"] = results["surface tension eq. (mN/m)"].astype(float)
+    for well_id, surface_tension_eq in surface_tensions_eq.items():
+        results.loc[well_ids == well_id, "surface tension eq. (mN/m)"] = surface_tension_eq
+    results.to_csv(file_name_results, index=False)
+    return results
+
+
 def load_commit_hash():
     try:
         commit_hash = (
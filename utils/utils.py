@@ -16,6 +16,19 @@ def calculate_equillibrium_value(x: list, n_eq_points: int, column_index: int):
         print(f"less than {n_eq_points} points.")
     return calculate_average_in_column(x=x, column_index=column_index)
 
+def calculate_equillibrium_value_in_window(
+    x: list, time_window: float, column_index: int, time_index: int = 0
+):
+    """
+    Average of the points in the last time_window seconds, independent of the
+    rate the points were measured at.
+    """
+    end_time = x[-1][time_index]
+    if end_time - x[0][time_index] < time_window:
+        print(f"less than {time_window} s of points.")
+    x = [item for item in x if item[time_index] >= end_time - time_window]
+    return calculate_average_in_column(x=x, column_index=column_index)
+
 def play_sound(text: str):
     engine = pyttsx3.init()
     engine.say(text)